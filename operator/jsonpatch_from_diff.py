@@ -1,5 +1,7 @@
 import re
 
+_missing = object()
+
 def filter_patch_item(item, update_filters):
     if not update_filters:
         return True
@@ -13,6 +15,35 @@ def filter_patch_item(item, update_filters):
             return True
     return False
 
+def filter_definition(definition, current, update_filters):
+    """
+    Return copy of definition limited to paths which update_filters allow to
+    be added or replaced in current. Paths which exist in current but may not
+    be replaced keep their current value so that server-side apply retains
+    ownership without changing them. Lists are only kept whole.
+    """
+    filtered = _filter_definition(definition, current, update_filters, [])
+    return {} if filtered is _missing else filtered
+
+def _filter_definition(value, current, update_filters, path):
+    if path:
+        op = 'add' if current is _missing else 'replace'
+        if filter_patch_item({'op': op, 'path': _jsonpatch_path(*path)}, update_filters):
+            return value
+    if isinstance(value, dict) and (current is _missing or isinstance(current, dict)):
+        filtered = {}
+        for k, v in value.items():
+            filtered_value = _filter_definition(
+                v,
+                _missing if current is _missing else current.get(k, _missing),
+                update_filters,
+                path + [k],
+            )
+            if filtered_value is not _missing:
+                filtered[k] = filtered_value
+        return filtered if filtered else _missing
+    return current
+
 def jsonpatch_from_diff(a, b, update_filters=None):
     patch = [ item for item in _jsonpatch_from_diff(a, b, []) ]
     if update_filters:
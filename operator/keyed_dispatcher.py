@@ -0,0 +1,64 @@
+import asyncio
+import logging
+
+logger = logging.getLogger('keyed_dispatcher')
+
+class KeyedDispatcher:
+    """
+    Run coroutine functions on a fixed pool of worker tasks.
+
+    Calls dispatched with the same key always go to the same worker so they
+    run in order while calls for different keys run concurrently. Dispatch
+    waits when the worker queue is full.
+    """
+    def __init__(self, workers=10, queue_size=100):
+        self.queue_size = queue_size
+        self.queues = []
+        self.tasks = []
+        self.workers = workers
+
+    @property
+    def is_running(self):
+        return len(self.tasks) > 0
+
+    @property
+    def queue_depth(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    async def dispatch(self, key, func, *args, **kwargs):
+        if not self.is_running:
+            self.start()
+        queue = self.queues[hash(key) % self.workers]
+        await queue.put((func, args, kwargs))
+
+    async def join(self):
+        """Wait for all dispatched calls to complete."""
+        for queue in self.queues:
+            await queue.join()
+
+    def start(self):
+        self.queues = [asyncio.Queue(maxsize=self.queue_size) for i in range(self.workers)]
+        self.tasks = [asyncio.create_task(self.__worker(queue)) for queue in self.queues]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.queues = []
+        self.tasks = []
+
+    async def __worker(self, queue):
+        while True:
+            func, args, kwargs = await queue.get()
+            try:
+                await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                # Only stop if this worker is cancelled, a call which raises
+                # CancelledError itself must not leave the queue undrained.
+                if asyncio.current_task().cancelling():
+                    raise
+                logger.exception(f"Cancelled in {func.__qualname__}")
+            except Exception:
+                logger.exception(f"Exception in {func.__qualname__}")
+            finally:
+                queue.task_done()
@@ -5,6 +5,7 @@ from typing import List, Mapping, Optional, TypeVar, Union
 
 import kopf
 import kubernetes_asyncio
+import poolboy_k8s
 
 from poolboy import Poolboy
 
@@ -86,7 +87,8 @@ class KopfObject:
 
     async def delete(self):
         try:
-            await Poolboy.custom_objects_api.delete_namespaced_custom_object(
+            await poolboy_k8s.call_raw(
+                Poolboy.custom_objects_api.delete_namespaced_custom_object,
                 group = self.api_group,
                 name = self.name,
                 namespace = self.namespace,
@@ -99,7 +101,8 @@ class KopfObject:
 
     async def json_patch(self, patch: List[Mapping]) -> None:
         """Apply json patch to object status and update definition."""
-        definition = await Poolboy.custom_objects_api.patch_namespaced_custom_object(
+        definition = await poolboy_k8s.call_raw(
+            Poolboy.custom_objects_api.patch_namespaced_custom_object,
             group = self.api_group,
             name = self.name,
             namespace = self.namespace,
@@ -111,7 +114,8 @@ class KopfObject:
         self.refresh_from_definition(definition)
 
     async def json_patch_status(self, patch: List[Mapping]) -> None:
-        definition = await Poolboy.custom_objects_api.patch_namespaced_custom_object_status(
+        definition = await poolboy_k8s.call_raw(
+            Poolboy.custom_objects_api.patch_namespaced_custom_object_status,
             group = self.api_group,
             name = self.name,
             namespace = self.namespace,
@@ -124,7 +128,8 @@ class KopfObject:
 
     async def merge_patch(self, patch: Mapping) -> None:
         """Apply merge patch to object status and update definition."""
-        definition = await Poolboy.custom_objects_api.patch_namespaced_custom_object(
+        definition = await poolboy_k8s.call_raw(
+            Poolboy.custom_objects_api.patch_namespaced_custom_object,
             group = self.api_group,
             name = self.name,
             namespace = self.namespace,
@@ -137,7 +142,8 @@ class KopfObject:
 
     async def merge_patch_status(self, patch: Mapping) -> None:
         """Apply merge patch to object status and update definition."""
-        definition = await Poolboy.custom_objects_api.patch_namespaced_custom_object_status(
+        definition = await poolboy_k8s.call_raw(
+            Poolboy.custom_objects_api.patch_namespaced_custom_object_status,
             group = self.api_group,
             name = self.name,
             namespace = self.namespace,
@@ -7,9 +7,12 @@ from copy import deepcopy
 from datetime import datetime, timedelta
 from typing import Any, Mapping, Optional
 
+import poolboy_k8s
+
 from poolboy import Poolboy
 from configure_kopf_logging import configure_kopf_logging
 from infinite_relative_backoff import InfiniteRelativeBackoff
+from poolboy_templating import template_render_executor
 
 from resourceclaim import ResourceClaim
 from resourcehandle import ResourceHandle
@@ -43,13 +46,23 @@ async def startup(logger: kopf.ObjectLogger, settings: kopf.OperatorSettings, **
 
     # Preload for matching ResourceClaim templates
     await Poolboy.on_startup()
+    await poolboy_k8s.discover_apis()
     await ResourceProvider.preload(logger=logger)
     await ResourceHandle.preload(logger=logger)
 
+    # Resync ResourceHandle status in the background with checks batched
+    # across handles.
+    ResourceHandle.update_status_all_task = asyncio.create_task(
+        ResourceHandle.update_status_all(logger=logger)
+    )
+
 
 @kopf.on.cleanup()
 async def cleanup(logger: kopf.ObjectLogger, **_):
+    if ResourceHandle.update_status_all_task:
+        ResourceHandle.update_status_all_task.cancel()
     await ResourceWatcher.stop_all()
+    template_render_executor.shutdown()
     await Poolboy.on_cleanup()
 
 
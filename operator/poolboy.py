@@ -2,14 +2,32 @@ import kubernetes_asyncio
 import os
 
 class Poolboy():
+    api_discovery_concurrency = int(os.environ.get('API_DISCOVERY_CONCURRENCY', 10))
+    api_discovery_ttl = int(os.environ.get('API_DISCOVERY_TTL', 600))
+    field_manager = os.environ.get('FIELD_MANAGER', 'poolboy')
+    jmespath_cache_size = int(os.environ.get('JMESPATH_CACHE_SIZE', 1000))
     manage_claims_interval = int(os.environ.get('MANAGE_CLAIMS_INTERVAL', 60))
     manage_handles_interval = int(os.environ.get('MANAGE_HANDLES_INTERVAL', 60))
     manage_pools_interval = int(os.environ.get('MANAGE_POOLS_INTERVAL', 10))
     operator_domain = os.environ.get('OPERATOR_DOMAIN', 'poolboy.gpte.redhat.com')
     operator_version = os.environ.get('OPERATOR_VERSION', 'v1')
     operator_api_version = f"{operator_domain}/{operator_version}"
+    requester_cache_ttl = int(os.environ.get('REQUESTER_CACHE_TTL', 300))
+    resource_event_coalesce_window = float(os.environ.get('RESOURCE_EVENT_COALESCE_WINDOW', 1))
+    resource_event_queue_size = int(os.environ.get('RESOURCE_EVENT_QUEUE_SIZE', 100))
+    resource_event_workers = int(os.environ.get('RESOURCE_EVENT_WORKERS', 10))
     resource_refresh_interval = int(os.environ.get('RESOURCE_REFRESH_INTERVAL', 600))
+    resource_watch_cluster_threshold = int(os.environ.get('RESOURCE_WATCH_CLUSTER_THRESHOLD', 0))
+    resource_watch_idle_timeout = int(os.environ.get('RESOURCE_WATCH_IDLE_TIMEOUT', 600))
+    resource_watch_list_limit = int(os.environ.get('RESOURCE_WATCH_LIST_LIMIT', 500))
+    resource_watch_sync_timeout = int(os.environ.get('RESOURCE_WATCH_SYNC_TIMEOUT', 30))
+    template_cache_size = int(os.environ.get('TEMPLATE_CACHE_SIZE', 1000))
+    template_render_cache_size = int(os.environ.get('TEMPLATE_RENDER_CACHE_SIZE', 10000))
+    template_render_workers = int(os.environ.get('TEMPLATE_RENDER_WORKERS', 0))
+    template_render_workers_threshold = int(os.environ.get('TEMPLATE_RENDER_WORKERS_THRESHOLD', 20))
     ignore_label = f"{operator_domain}/ignore"
+    managed_label = f"{operator_domain}/managed"
+    watch_managed_resources_only = os.environ.get('WATCH_MANAGED_RESOURCES_ONLY', 'false').lower() == 'true'
 
     @classmethod
     async def on_cleanup(cls):
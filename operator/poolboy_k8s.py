@@ -1,111 +1,194 @@
 import asyncio
+import functools
 import inflection
 import kopf
 import kubernetes_asyncio
+import logging
+import orjson
+import time
 
-from typing import List, Mapping, Optional
+from typing import Any, Callable, List, Mapping, Optional, Tuple
 
 from poolboy import Poolboy
 
-api_groups = {}
+logger = logging.getLogger('poolboy_k8s')
+
+# Map of (group, version, kind) to (plural, namespaced) from API discovery
+api_kinds = {}
+# Monotonic time of last discovery by (group, version)
+api_discovery_times = {}
+# Discovery requests in progress by (group, version)
+api_discovery_tasks = {}
+# Map of namespace to (monotonic time, requester user, requester identities)
+requester_cache = {}
 
 class KindNotFoundException(Exception):
     pass
 
-async def create_object(definition: Mapping) -> Mapping:
-    if '/' in definition['apiVersion']:
-        return await create_custom_object(definition)
+class RawWatch(kubernetes_asyncio.watch.Watch):
+    """Watch which returns event objects as parsed JSON rather than models."""
+    def get_return_type(self, func: Callable) -> None:
+        return None
+
+# Typed API classes for built-in API group versions, other API versions are
+# accessed through the custom objects API.
+typed_api_classes = {
+    'v1': kubernetes_asyncio.client.CoreV1Api,
+    'admissionregistration.k8s.io/v1': kubernetes_asyncio.client.AdmissionregistrationV1Api,
+    'apiextensions.k8s.io/v1': kubernetes_asyncio.client.ApiextensionsV1Api,
+    'apiregistration.k8s.io/v1': kubernetes_asyncio.client.ApiregistrationV1Api,
+    'apps/v1': kubernetes_asyncio.client.AppsV1Api,
+    'autoscaling/v1': kubernetes_asyncio.client.AutoscalingV1Api,
+    'autoscaling/v2': kubernetes_asyncio.client.AutoscalingV2Api,
+    'batch/v1': kubernetes_asyncio.client.BatchV1Api,
+    'certificates.k8s.io/v1': kubernetes_asyncio.client.CertificatesV1Api,
+    'coordination.k8s.io/v1': kubernetes_asyncio.client.CoordinationV1Api,
+    'discovery.k8s.io/v1': kubernetes_asyncio.client.DiscoveryV1Api,
+    'events.k8s.io/v1': kubernetes_asyncio.client.EventsV1Api,
+    'networking.k8s.io/v1': kubernetes_asyncio.client.NetworkingV1Api,
+    'node.k8s.io/v1': kubernetes_asyncio.client.NodeV1Api,
+    'policy/v1': kubernetes_asyncio.client.PolicyV1Api,
+    'rbac.authorization.k8s.io/v1': kubernetes_asyncio.client.RbacAuthorizationV1Api,
+    'scheduling.k8s.io/v1': kubernetes_asyncio.client.SchedulingV1Api,
+    'storage.k8s.io/v1': kubernetes_asyncio.client.StorageV1Api,
+}
+typed_api_verbs = ('create', 'delete', 'list', 'patch', 'read')
+# Map of (apiVersion, verb, underscored kind, namespaced) to typed API method
+typed_api_methods = {}
+
+async def apply_object(definition: Mapping, force: bool = False) -> Mapping:
+    """
+    Server-side apply definition using the Poolboy field manager. With force
+    Poolboy takes ownership of fields managed by others, otherwise conflicts
+    raise an ApiException with status 409.
+    """
+    if definition['apiVersion'] in typed_api_classes:
+        return await apply_core_object(definition, force=force)
     else:
-        return await create_core_object(definition)
+        return await apply_custom_object(definition, force=force)
 
-async def create_core_object(definition: Mapping) -> Mapping:
-    if 'namespace' in definition['metadata']:
-        return await create_namespaced_core_object(definition)
-    else:
-        return await create_cluster_core_object(definition)
+async def apply_core_object(definition: Mapping, force: bool = False) -> Mapping:
+    namespace = definition['metadata'].get('namespace')
+    method = get_typed_api_method(
+        api_version = definition['apiVersion'],
+        kind = definition['kind'],
+        namespaced = bool(namespace),
+        verb = 'patch',
+    )
+    kwargs = dict(namespace=namespace) if namespace else {}
+    return await call_raw(
+        method,
+        name = definition['metadata']['name'],
+        body = definition,
+        field_manager = Poolboy.field_manager,
+        force = force,
+        _content_type = 'application/apply-patch+yaml',
+        **kwargs
+    )
 
-async def create_custom_object(definition: Mapping) -> Mapping:
+async def apply_custom_object(definition: Mapping, force: bool = False) -> Mapping:
     group, version = definition['apiVersion'].split('/')
     plural = await kind_to_plural(group=group, kind=definition['kind'], version=version)
     namespace = definition['metadata'].get('namespace')
     if namespace:
-        return await Poolboy.custom_objects_api.create_namespaced_custom_object(
+        return await call_raw(
+            Poolboy.custom_objects_api.patch_namespaced_custom_object,
             body = definition,
             group = group,
+            name = definition['metadata']['name'],
             namespace = namespace,
             plural = plural,
             version = version,
+            field_manager = Poolboy.field_manager,
+            force = force,
+            _content_type = 'application/apply-patch+yaml',
         )
     else:
-        return await Poolboy.custom_objects_api.create_cluster_custom_object(
+        return await call_raw(
+            Poolboy.custom_objects_api.patch_cluster_custom_object,
             body = definition,
             group = group,
+            name = definition['metadata']['name'],
             plural = plural,
             version = version,
+            field_manager = Poolboy.field_manager,
+            force = force,
+            _content_type = 'application/apply-patch+yaml',
         )
 
-async def create_cluster_core_object(definition: Mapping) -> Mapping:
-    kind = definition['kind']
-    method = getattr(
-        Poolboy.core_v1_api,
-        'create_' + inflection.underscore(kind)
-    )
-    return Poolboy.api_client.sanitize_for_serialization(
-        await method(body=definition)
-    )
+async def call_raw(func: Callable, /, *args, **kwargs) -> Any:
+    """
+    Call API method and return response body parsed as JSON, skipping
+    deserialization into kubernetes_asyncio models.
+    """
+    response = await func(*args, _preload_content=False, **kwargs)
+    try:
+        data = await response.read()
+        if not 200 <= response.status <= 299:
+            raise kubernetes_asyncio.client.exceptions.ApiException(
+                http_resp=kubernetes_asyncio.client.rest.RESTResponse(response, data)
+            )
+    finally:
+        response.release()
+    return orjson.loads(data) if data else None
 
-async def create_namespaced_core_object(definition: Mapping) -> Mapping:
-    kind = definition['kind']
-    namespace = definition['metadata']['namespace']
-    method = getattr(
-        Poolboy.core_v1_api,
-        'create_namespaced_' + inflection.underscore(kind)
-    )
-    return Poolboy.api_client.sanitize_for_serialization(
-        await method(body=definition, namespace=namespace)
+async def create_object(definition: Mapping) -> Mapping:
+    if definition['apiVersion'] in typed_api_classes:
+        return await create_core_object(definition)
+    else:
+        return await create_custom_object(definition)
+
+async def create_core_object(definition: Mapping) -> Mapping:
+    namespace = definition['metadata'].get('namespace')
+    method = get_typed_api_method(
+        api_version = definition['apiVersion'],
+        kind = definition['kind'],
+        namespaced = bool(namespace),
+        verb = 'create',
     )
+    if namespace:
+        return await call_raw(method, body=definition, namespace=namespace)
+    else:
+        return await call_raw(method, body=definition)
 
-async def delete_core_object(
-    kind: str,
-    name: str,
-    namespace: Optional[str] = None,
-) -> Mapping:
+async def create_custom_object(definition: Mapping) -> Mapping:
+    group, version = definition['apiVersion'].split('/')
+    plural = await kind_to_plural(group=group, kind=definition['kind'], version=version)
+    namespace = definition['metadata'].get('namespace')
     if namespace:
-        return await delete_namespaced_core_object(
-            kind = kind,
-            name = name,
+        return await call_raw(
+            Poolboy.custom_objects_api.create_namespaced_custom_object,
+            body = definition,
+            group = group,
             namespace = namespace,
+            plural = plural,
+            version = version,
         )
     else:
-        return await delete_cluster_core_object(
-            kind = kind,
-            name = name,
+        return await call_raw(
+            Poolboy.custom_objects_api.create_cluster_custom_object,
+            body = definition,
+            group = group,
+            plural = plural,
+            version = version,
         )
 
-async def delete_cluster_core_object(
-    kind: str,
-    name: str,
-) -> Mapping:
-    method = getattr(
-        Poolboy.core_v1_api,
-        'delete_' + inflection.underscore(kind)
-    )
-    return Poolboy.api_client.sanitize_for_serialization(
-        await method(name=name)
-    )
-
-async def delete_namespaced_core_object(
+async def delete_core_object(
+    api_version: str,
     kind: str,
     name: str,
-    namespace: str,
+    namespace: Optional[str] = None,
 ) -> Mapping:
-    method = getattr(
-        Poolboy.core_v1_api,
-        'delete_namespaced_' + inflection.underscore(kind)
-    )
-    return Poolboy.api_client.sanitize_for_serialization(
-        await method(name=name, namespace=namespace)
+    method = get_typed_api_method(
+        api_version = api_version,
+        kind = kind,
+        namespaced = bool(namespace),
+        verb = 'delete',
     )
+    if namespace:
+        return await call_raw(method, name=name, namespace=namespace)
+    else:
+        return await call_raw(method, name=name)
 
 async def delete_custom_object(
     group: str,
@@ -116,7 +199,8 @@ async def delete_custom_object(
 ) -> Optional[Mapping]:
     plural = await kind_to_plural(group=group, kind=kind, version=version)
     if namespace:
-        return await Poolboy.custom_objects_api.delete_namespaced_custom_object(
+        return await call_raw(
+            Poolboy.custom_objects_api.delete_namespaced_custom_object,
             group = group,
             name = name,
             namespace = namespace,
@@ -124,7 +208,8 @@ async def delete_custom_object(
             version = version,
         )
     else:
-        return await Poolboy.custom_objects_api.delete_cluster_custom_object(
+        return await call_raw(
+            Poolboy.custom_objects_api.delete_cluster_custom_object,
             group = group,
             name = name,
             plural = plural,
@@ -137,7 +222,7 @@ async def delete_object(
     name: str,
     namespace: str = None,
 ) -> Optional[Mapping]:
-    if '/' in api_version:
+    if api_version not in typed_api_classes:
         group, version = api_version.split('/')
         return await delete_custom_object(
             group = group,
@@ -148,18 +233,38 @@ async def delete_object(
         )
     else:
         return await delete_core_object(
+            api_version = api_version,
             kind = kind,
             name = name,
             namespace = namespace
         )
 
+def get_typed_api_method(
+    api_version: str,
+    kind: str,
+    namespaced: bool,
+    verb: str,
+) -> Callable:
+    """
+    Return typed API method for verb on kind. Methods which are not namespaced
+    include list for all namespaces for namespaced kinds.
+    """
+    if not typed_api_methods:
+        _build_typed_api_methods()
+    method = typed_api_methods.get((api_version, verb, _kind_underscore(kind), namespaced))
+    if not method:
+        raise KindNotFoundException(
+            f"Unable to {verb} {'namespaced ' if namespaced else ''}{kind} in {api_version}"
+        )
+    return method
+
 async def get_object(
     api_version: str,
     kind: str,
     name: str,
     namespace: Optional[str] = None,
 ) -> Optional[Mapping]:
-    if '/' in api_version:
+    if api_version not in typed_api_classes:
         group, version = api_version.split('/')
         return await get_custom_object(
             group = group,
@@ -170,52 +275,28 @@ async def get_object(
         )
     else:
         return await get_core_object(
+            api_version = api_version,
             kind = kind,
             name = name,
             namespace = namespace
         )
 
 async def get_core_object(
+    api_version: str,
     kind: str,
     name: str,
     namespace: Optional[str] = None,
 ) -> Mapping:
+    method = get_typed_api_method(
+        api_version = api_version,
+        kind = kind,
+        namespaced = bool(namespace),
+        verb = 'read',
+    )
     if namespace:
-        return await get_namespaced_core_object(
-            kind = kind,
-            name = name,
-            namespace = namespace,
-        )
+        return await call_raw(method, name=name, namespace=namespace)
     else:
-        return await get_cluster_core_object(
-            kind = kind,
-            name = name,
-        )
-
-async def get_cluster_core_object(
-    kind: str,
-    name: str,
-) -> Mapping:
-    method = getattr(
-        Poolboy.core_v1_api,
-        'read_' + inflection.underscore(kind)
-    )
-    return Poolboy.api_client.sanitize_for_serialization(
-        await method(name=name)
-    )
-
-async def get_namespaced_core_object(
-    kind: str,
-    name: str,
-    namespace: str,
-) -> Mapping:
-    method = getattr(
-        Poolboy.core_v1_api,
-        'read_namespaced_' + inflection.underscore(kind)
-    )
-    return Poolboy.api_client.sanitize_for_serialization(
-        await method(name=name, namespace=namespace)
-    )
+        return await call_raw(method, name=name)
 
 async def get_custom_object(
     group: str,
@@ -226,7 +307,8 @@ async def get_custom_object(
 ) -> Optional[Mapping]:
     plural = await kind_to_plural(group=group, kind=kind, version=version)
     if namespace:
-        return await Poolboy.custom_objects_api.get_namespaced_custom_object(
+        return await call_raw(
+            Poolboy.custom_objects_api.get_namespaced_custom_object,
             group = group,
             name = name,
             namespace = namespace,
@@ -234,7 +316,8 @@ async def get_custom_object(
             version = version,
         )
     else:
-        return await Poolboy.custom_objects_api.get_cluster_custom_object(
+        return await call_raw(
+            Poolboy.custom_objects_api.get_cluster_custom_object,
             group = group,
             name = name,
             plural = plural,
@@ -242,20 +325,40 @@ async def get_custom_object(
         )
 
 async def get_requester_from_namespace(namespace: str) -> tuple[Optional[Mapping], Optional[List[Mapping]]]:
+    """
+    Return requester user and identities for namespace. Results are cached
+    for the requester cache TTL.
+    """
+    now = time.monotonic()
+    cached = requester_cache.get(namespace)
+    if cached and now - cached[0] < Poolboy.requester_cache_ttl:
+        return cached[1], cached[2]
+
+    user, identities = await _get_requester_from_namespace(namespace)
+
+    for expired_namespace in [
+        k for k, v in requester_cache.items() if now - v[0] >= Poolboy.requester_cache_ttl
+    ]:
+        del requester_cache[expired_namespace]
+    requester_cache[namespace] = (now, user, identities)
+    return user, identities
+
+async def _get_requester_from_namespace(namespace: str) -> tuple[Optional[Mapping], Optional[List[Mapping]]]:
     try:
-        namespace_obj = await Poolboy.core_v1_api.read_namespace(namespace)
+        namespace_obj = await call_raw(Poolboy.core_v1_api.read_namespace, namespace)
     except kubernetes_asyncio.client.exceptions.ApiException as e:
         if e.status == 404:
             return None, []
         else:
             raise
 
-    user_name = namespace_obj.metadata.annotations.get('openshift.io/requester')
+    user_name = namespace_obj['metadata'].get('annotations', {}).get('openshift.io/requester')
     if not user_name:
         return None, []
 
     try:
-        user = await Poolboy.custom_objects_api.get_cluster_custom_object(
+        user = await call_raw(
+            Poolboy.custom_objects_api.get_cluster_custom_object,
             'user.openshift.io', 'v1', 'users', user_name
         )
     except kubernetes_asyncio.client.exceptions.ApiException as e:
@@ -270,127 +373,191 @@ async def get_requester_from_namespace(namespace: str) -> tuple[Optional[Mapping
         else:
             raise
 
-    identities = []
-    for identity_name in user.get('identities', []):
-        try:
-            identity = await Poolboy.custom_objects_api.get_cluster_custom_object(
-                'user.openshift.io', 'v1', 'identities', identity_name
-            )
-            identities.append(identity)
-        except kubernetes_asyncio.client.exceptions.ApiException as e:
-            if e.status == 404:
-                identities.append({
-                    "metadata": {
-                        "name": identity_name,
-                    },
-                    "extra": {},
-                })
-            else:
-                raise
-
-    return user, identities
+    identities = await asyncio.gather(
+        *[_get_identity(identity_name) for identity_name in user.get('identities', [])]
+    )
+    return user, list(identities)
 
+async def _get_identity(identity_name: str) -> Mapping:
+    try:
+        return await call_raw(
+            Poolboy.custom_objects_api.get_cluster_custom_object,
+            'user.openshift.io', 'v1', 'identities', identity_name
+        )
+    except kubernetes_asyncio.client.exceptions.ApiException as e:
+        if e.status == 404:
+            return {
+                "metadata": {
+                    "name": identity_name,
+                },
+                "extra": {},
+            }
+        else:
+            raise
 
-async def kind_to_plural(
-    group: str,
-    kind: str,
-    version: str,
-) -> str:
-    api_group = api_groups.get(group)
-    if api_group:
-        api_group_version  = api_group.get(version)
-        if api_group_version:
-            for resource in api_group_version['resources']:
-                if resource['kind'] == kind:
-                    return resource['name']
 
+def _build_typed_api_methods() -> None:
+    for api_version, api_class in typed_api_classes.items():
+        api = api_class(Poolboy.api_client)
+        for method_name in dir(api_class):
+            if method_name.endswith('_with_http_info'):
+                continue
+            verb, _, name = method_name.partition('_')
+            if verb not in typed_api_verbs or name.startswith('collection_'):
+                continue
+            if name.startswith('namespaced_'):
+                key = (api_version, verb, name[len('namespaced_'):], True)
+            elif name.endswith('_for_all_namespaces'):
+                key = (api_version, verb, name[:-len('_for_all_namespaces')], False)
+            else:
+                key = (api_version, verb, name, False)
+            typed_api_methods[key] = getattr(api, method_name)
+
+async def discover_api_group_version(group: str, version: str) -> None:
+    """
+    Fetch API discovery for group version and update api_kinds. Concurrent
+    requests for the same group version share one API call.
+    """
+    key = (group, version)
+    task = api_discovery_tasks.get(key)
+    if not task:
+        task = asyncio.create_task(_discover_api_group_version(group=group, version=version))
+        api_discovery_tasks[key] = task
+        task.add_done_callback(lambda _: api_discovery_tasks.pop(key, None))
+    await asyncio.shield(task)
+
+async def _discover_api_group_version(group: str, version: str) -> None:
+    api_group_version = await call_raw(
+        Poolboy.api_client.call_api,
+        method = 'GET',
+        resource_path = f"/apis/{group}/{version}" if group else f"/api/{version}",
+        auth_settings=['BearerToken'],
+    )
+    for (api_kind_group, api_kind_version, kind) in [
+        k for k in api_kinds.keys() if k[0] == group and k[1] == version
+    ]:
+        del api_kinds[(api_kind_group, api_kind_version, kind)]
+    for resource in api_group_version['resources']:
+        # Skip subresources such as status and scale
+        if '/' in resource['name']:
+            continue
+        api_kinds[(group, version, resource['kind'])] = (resource['name'], resource['namespaced'])
+    api_discovery_times[(group, version)] = time.monotonic()
+
+async def discover_apis() -> None:
+    """
+    Fetch API discovery for all API group versions with limited concurrency,
+    intended to be called on startup to avoid discovery on first use of each
+    kind. Failures are logged and leave discovery to happen on first use.
+    """
     try:
-        resp = await Poolboy.api_client.call_api(
+        api_group_list = await call_raw(
+            Poolboy.api_client.call_api,
             method = 'GET',
-            resource_path = f"/apis/{group}/{version}",
+            resource_path = "/apis",
             auth_settings=['BearerToken'],
-            response_types_map = {
-                200: "object",
-            }
         )
+        group_versions = [('', 'v1')]
+        for api_group in api_group_list['groups']:
+            for group_version in api_group['versions']:
+                group_versions.append((api_group['name'], group_version['version']))
+    except Exception as exception:
+        logger.warning(f"Failed API group discovery, discovering kinds on first use: {exception}")
+        return
+
+    semaphore = asyncio.Semaphore(max(1, Poolboy.api_discovery_concurrency))
+    async def discover(group: str, version: str) -> None:
+        async with semaphore:
+            await discover_api_group_version(group=group, version=version)
+
+    results = await asyncio.gather(
+        *[discover(group=group, version=version) for group, version in group_versions],
+        return_exceptions = True,
+    )
+    for (group, version), result in zip(group_versions, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Failed API discovery for {group}/{version}: {result}")
+    logger.info(f"Discovered {len(api_kinds)} kinds in {len(group_versions)} API group versions")
+
+async def get_api_kind(
+    group: str,
+    version: str,
+    kind: str,
+) -> Tuple[str, bool]:
+    """
+    Return plural name and whether kind is namespaced. Discovery is refreshed
+    once the cached result is older than the discovery TTL or if the kind is
+    not found so that CustomResourceDefinitions added after startup are used.
+    """
+    key = (group, version, kind)
+    api_kind = api_kinds.get(key)
+    discovery_time = api_discovery_times.get((group, version))
+    if api_kind and time.monotonic() - discovery_time < Poolboy.api_discovery_ttl:
+        return api_kind
+
+    try:
+        await discover_api_group_version(group=group, version=version)
     except kubernetes_asyncio.client.exceptions.ApiException as e:
+        if api_kind:
+            logger.warning(f"Failed to refresh API discovery for {group}/{version}: {e}")
+            return api_kind
         if e.status == 404:
             raise kopf.TemporaryError(
                 f"API {group}/{version} not found",
-                delay=600
+                delay=60
             )
         else:
             raise
 
-    api_group_version = resp[0]
-    if group not in api_groups:
-        api_groups[group] = {}
-    api_groups[group][version] = api_group_version
-
-    for resource in api_group_version['resources']:
-        if resource['kind'] == kind:
-            return resource['name']
+    api_kind = api_kinds.get(key)
+    if api_kind:
+        return api_kind
 
     raise kopf.TemporaryError(
-        f"API {group}/version does not have kind {kind}",
-        delay=600
+        f"API {group}/{version} does not have kind {kind}",
+        delay=60
     )
 
+@functools.lru_cache(maxsize=None)
+def _kind_underscore(kind: str) -> str:
+    return inflection.underscore(kind)
+
+async def kind_to_plural(
+    group: str,
+    kind: str,
+    version: str,
+) -> str:
+    plural, namespaced = await get_api_kind(group=group, kind=kind, version=version)
+    return plural
+
 async def patch_core_object(
+    api_version: str,
     kind: str,
     name: str,
     namespace: str,
     patch: List[Mapping],
 ) -> Mapping:
+    method = get_typed_api_method(
+        api_version = api_version,
+        kind = kind,
+        namespaced = bool(namespace),
+        verb = 'patch',
+    )
     if namespace:
-        return await patch_namespaced_core_object(
-            kind = kind,
+        return await call_raw(
+            method,
             name = name,
             namespace = namespace,
-            patch = patch,
-        )
-    else:
-        return await patch_cluster_core_object(
-            kind = kind,
-            name = name,
-            patch = patch,
-        )
-
-async def patch_cluster_core_object(
-    kind: str,
-    name: str,
-    patch: List[Mapping],
-) -> Mapping:
-    method = getattr(
-        Poolboy.core_v1_api,
-        'patch_' + inflection.underscore(kind)
-    )
-    return Poolboy.api_client.sanitize_for_serialization(
-        await method(
-            name = name,
             body = patch,
             _content_type = 'application/json-patch+json',
         )
-    )
-
-async def patch_namespaced_core_object(
-    kind: str,
-    name: str,
-    namespace: str,
-    patch: List[Mapping],
-) -> Mapping:
-    method = getattr(
-        Poolboy.core_v1_api,
-        'patch_namespaced_' + inflection.underscore(kind)
-    )
-    return Poolboy.api_client.sanitize_for_serialization(
-        await method(
+    else:
+        return await call_raw(
+            method,
             name = name,
-            namespace = namespace,
             body = patch,
             _content_type = 'application/json-patch+json',
         )
-    )
 
 async def patch_custom_object(
     group: str,
@@ -402,7 +569,8 @@ async def patch_custom_object(
 ) -> Mapping:
     plural = await kind_to_plural(group=group, kind=kind, version=version)
     if namespace:
-        return await Poolboy.custom_objects_api.patch_namespaced_custom_object(
+        return await call_raw(
+            Poolboy.custom_objects_api.patch_namespaced_custom_object,
             group = group,
             name = name,
             namespace = namespace,
@@ -412,7 +580,8 @@ async def patch_custom_object(
             _content_type = 'application/json-patch+json',
         )
     else:
-        return await Poolboy.custom_objects_api.patch_cluster_custom_object(
+        return await call_raw(
+            Poolboy.custom_objects_api.patch_cluster_custom_object,
             group = group,
             name = name,
             plural = plural,
@@ -428,7 +597,7 @@ async def patch_object(
     patch: List[Mapping],
     namespace: Optional[str] = None,
 ) -> List:
-    if '/' in api_version:
+    if api_version not in typed_api_classes:
         group, version = api_version.split('/')
         return await patch_custom_object(
             group = group,
@@ -440,6 +609,7 @@ async def patch_object(
         )
     else:
         return await patch_core_object(
+            api_version = api_version,
             kind = kind,
             name = name,
             namespace = namespace,
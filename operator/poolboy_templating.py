@@ -1,16 +1,24 @@
-import copy
+import asyncio
 import functools
+import hashlib
 import jinja2
+import jinja2.meta
 import jmespath
 import json
 import pytimeparse
 import random
 import re
+import threading
 
+from collections import ChainMap, OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from distutils.util import strtobool
 from strgen import StringGenerator
 
+from poolboy import Poolboy
+
 class TimeStamp(object):
     def __init__(self, set_datetime=None):
         if not set_datetime:
@@ -65,6 +73,147 @@ class TimeStamp(object):
     def utcnow(self):
         return TimeStamp()
 
+class CurrentTimeStamp(TimeStamp):
+    """TimeStamp which always represents the current time when used."""
+    def __init__(self):
+        pass
+
+    @property
+    def datetime(self):
+        return datetime.now(timezone.utc)
+
+class LRUCache:
+    """Bounded mapping which evicts least recently used entries."""
+    def __init__(self, maxsize=1000):
+        self.cache = OrderedDict()
+        self.evictions = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+        self.maxsize = maxsize
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.cache)
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.evictions = 0
+            self.hits = 0
+            self.misses = 0
+
+    def lookup(self, key):
+        """Return cached value for key or None, counting the hit or miss."""
+        with self.lock:
+            value = self.cache.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return value
+
+    def store(self, key, value):
+        with self.lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+                self.evictions += 1
+
+class RenderCache(LRUCache):
+    """
+    Bounded LRU cache of rendered template trees. Each key, such as a
+    ResourceHandle, holds one rendering which is used while the fingerprint of
+    the referenced variables is unchanged.
+    """
+    def get(self, key, fingerprint):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None or entry[0] != fingerprint:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, fingerprint, value):
+        self.store(key, (fingerprint, value))
+
+class TemplateCache(LRUCache):
+    """Bounded LRU cache of compiled templates keyed by template style and source."""
+    def get(self, template, template_style='jinja2'):
+        key = (template_style, template)
+        j2template = self.lookup(key)
+        if not j2template:
+            j2template = CompiledTemplate(template, template_style)
+            self.store(key, j2template)
+        return j2template
+
+class JMESPathCache(LRUCache):
+    """Bounded LRU cache of compiled JMESPath expressions keyed by query."""
+    def get(self, query):
+        expression = self.lookup(query)
+        if not expression:
+            expression = jmespath.compile(query)
+            self.store(query, expression)
+        return expression
+
+    def search(self, query, data):
+        return self.get(query).search(data)
+
+class TemplateRenderExecutor:
+    """
+    Bounded thread pool for rendering large template trees off of the event
+    loop. Trees with fewer dynamic strings than the threshold are rendered
+    inline, as are all trees when no workers are configured.
+    """
+    def __init__(self, max_workers=0, threshold=20):
+        self.active = 0
+        self.executor = None
+        self.max_workers = max_workers
+        self.offloaded = 0
+        self.semaphore = None
+        self.threshold = threshold
+        self.waiting = 0
+
+    @property
+    def enabled(self):
+        return self.max_workers > 0
+
+    @property
+    def queue_depth(self):
+        return self.active + self.waiting
+
+    async def render(self, template_tree, variables, cache_key=None):
+        if not self.enabled or template_tree.dynamic_count < self.threshold:
+            return template_tree.render(variables, cache_key)
+        if not self.executor:
+            self.executor = ThreadPoolExecutor(
+                max_workers = self.max_workers,
+                thread_name_prefix = 'template-render',
+            )
+            self.semaphore = asyncio.Semaphore(self.max_workers)
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.offloaded += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, template_tree.render, variables, cache_key
+            )
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
 def error_if_undefined(result):
     if isinstance(result, jinja2.Undefined):
         result._fail_with_undefined_error()
@@ -106,7 +255,7 @@ jinja2envs = {
     ),
 }
 jinja2envs['jinja2'].filters['bool'] = lambda x: bool(strtobool(x)) if isinstance(x, str) else bool(x)
-jinja2envs['jinja2'].filters['json_query'] = lambda x, query: jmespath.search(query, x)
+jinja2envs['jinja2'].filters['json_query'] = lambda x, query: jmespath_cache.search(query, x)
 jinja2envs['jinja2'].filters['merge_list_of_dicts'] = lambda a: functools.reduce(lambda d1, d2: {**(d1 or {}), **(d2 or {})}, a) if a else {}
 jinja2envs['jinja2'].filters['object'] = lambda x: json.dumps(x)
 jinja2envs['jinja2'].filters['parse_time_interval'] = lambda x: timedelta(seconds=pytimeparse.parse(x))
@@ -114,6 +263,13 @@ jinja2envs['jinja2'].filters['strgen'] = lambda x: StringGenerator(x).render()
 jinja2envs['jinja2'].filters['to_datetime'] = lambda s, f='%Y-%m-%d %H:%M:%S': datetime.strptime(s, f)
 jinja2envs['jinja2'].filters['to_json'] = lambda x: json.dumps(x)
 
+jmespath_cache = JMESPathCache(maxsize=Poolboy.jmespath_cache_size)
+template_cache = TemplateCache(maxsize=Poolboy.template_cache_size)
+template_render_executor = TemplateRenderExecutor(
+    max_workers = Poolboy.template_render_workers,
+    threshold = Poolboy.template_render_workers_threshold,
+)
+
 # Regex to detect if it looks like this value should be rendered as a raw type
 # rather than a string.
 #
@@ -142,7 +298,132 @@ jinja2envs['jinja2'].filters['to_json'] = lambda x: json.dumps(x)
 #   object_raw:
 #     user:
 #       name: alice
-type_filter_match_re = re.compile(r'^{{(?!.*{{).*\| *(bool|float|int|object) *}}$')
+type_filter_match_re = re.compile(r'^{{(?!.*{{)(.*)\| *(bool|float|int|object) *}}$')
+
+def json_value(value):
+    """
+    Return value as it would be after a round trip through JSON, copying
+    containers directly rather than serializing when possible.
+    """
+    if value is None or isinstance(value, (bool, float, int, str)):
+        return value
+    elif isinstance(value, Mapping):
+        if all(isinstance(key, str) for key in value.keys()):
+            return {key: json_value(val) for key, val in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [json_value(item) for item in value]
+    return json.loads(json.dumps(value))
+
+class CompiledTemplate:
+    """
+    Compiled template string.
+
+    Templates which consist of a single expression with a type filter are
+    compiled as expressions so that they render to native values without
+    converting the result to a string and parsing it back.
+    """
+    def __init__(self, template, template_style='jinja2'):
+        jinja2env = jinja2envs[template_style]
+        self.expression = None
+        self.j2template = None
+        self.type_filter = None
+
+        type_filter_match = type_filter_match_re.match(template)
+        if type_filter_match:
+            self.type_filter = type_filter_match.group(2)
+            try:
+                if self.type_filter == 'object':
+                    self.expression = jinja2env.compile_expression(
+                        type_filter_match.group(1), undefined_to_none=False
+                    )
+                else:
+                    self.expression = jinja2env.compile_expression(
+                        f"{type_filter_match.group(1)}|{self.type_filter}", undefined_to_none=False
+                    )
+            except jinja2.TemplateSyntaxError:
+                # Not a simple expression, fall back to rendering as a template
+                pass
+
+        if not self.expression:
+            self.j2template = jinja2env.from_string(template)
+
+    def render(self, variables):
+        if self.expression:
+            value = error_if_undefined(evaluate_expression(self.expression, variables))
+            if self.type_filter == 'object':
+                return json_value(value)
+            return value
+
+        # Equivalent to Template.render without copying variables into a new
+        # dict, relies on Jinja2 internals as of the pinned Jinja2==3.1.4.
+        try:
+            template_out = self.j2template.environment.concat(
+                self.j2template.root_render_func(
+                    self.j2template.new_context(variables, shared=True)
+                )
+            )
+        except Exception:
+            self.j2template.environment.handle_exception()
+        if not self.type_filter:
+            return template_out
+        try:
+            if self.type_filter == 'bool':
+                return bool(strtobool(template_out))
+            elif self.type_filter == 'float':
+                return float(template_out)
+            elif self.type_filter == 'int':
+                return int(template_out)
+            elif self.type_filter == 'object':
+                return json.loads(template_out)
+        except ValueError:
+            pass
+
+class CompiledCondition:
+    """
+    Condition compiled once as a Jinja2 expression and evaluated with the same
+    semantics as rendering "{{ (condition) | bool }}".
+
+    Syntax errors are raised on evaluation rather than on compile so that an
+    invalid condition fails the same way as it would when rendered.
+    """
+    def __init__(self, condition, template_style='jinja2'):
+        self.condition = condition
+        self.compile_error = None
+        self.expression = None
+        self.template_style = template_style
+        try:
+            self.expression = jinja2envs[template_style].compile_expression(
+                f"({condition})|bool", undefined_to_none=False
+            )
+        except jinja2.TemplateSyntaxError as exception:
+            self.compile_error = exception
+
+    def evaluate(self, variables={}):
+        if self.compile_error:
+            raise self.compile_error
+        return error_if_undefined(
+            evaluate_expression(self.expression, template_context(variables, self.template_style))
+        )
+
+    def evaluate_many(self, variables_list):
+        """
+        Evaluate condition for each mapping of variables with a shared base
+        context. Exceptions are returned in place of results so that a failure
+        for one item does not prevent evaluation of the others.
+        """
+        context = template_context({}, self.template_style)
+        results = []
+        for variables in variables_list:
+            context.maps[1] = variables
+            try:
+                if self.compile_error:
+                    raise self.compile_error
+                results.append(error_if_undefined(
+                    evaluate_expression(self.expression, context)
+                ))
+            except Exception as exception:
+                results.append(exception)
+        return results
 
 def check_condition(condition, template_style='jinja2', variables={}):
     return jinja2process(
@@ -155,73 +436,266 @@ def j2now(utc=False, fmt=None):
     dt = datetime.now(timezone.utc if utc else None)
     return dt.strftime(fmt) if fmt else dt
 
+# Helpers take precedence over variables of the same name when rendering.
+template_helpers = dict(
+    datetime = datetime,
+    now = j2now,
+    timedelta = timedelta,
+    timezone = timezone,
+    timestamp = CurrentTimeStamp(),
+)
+jinja2envs['jinja2'].globals.update(template_helpers)
+
 def jinja2process(template, omit=None, template_style='jinja2', variables={}):
-    variables = copy.copy(variables)
-    variables['datetime'] = datetime
-    variables['now'] = j2now
-    variables['omit'] = omit
-    variables['timedelta'] = timedelta
-    variables['timezone'] = timezone
-    variables['timestamp'] = TimeStamp()
-    jinja2env = jinja2envs.get(template_style)
-    j2template = jinja2env.from_string(template)
-    template_out = j2template.render(variables)
-
-    type_filter_match = type_filter_match_re.match(template)
-    if type_filter_match:
-        type_filter = type_filter_match.group(1)
-        try:
-            if type_filter == 'bool':
-                return bool(strtobool(template_out))
-            elif type_filter == 'float':
-                return float(template_out)
-            elif type_filter == 'int':
-                return int(template_out)
-            elif type_filter == 'object':
-                return json.loads(template_out)
-        except ValueError:
-            pass
-    else:
-        return template_out
+    return template_cache.get(template, template_style).render(
+        template_context(variables, template_style, omit=omit)
+    )
+
+def template_context(variables, template_style='jinja2', omit=None):
+    """
+    Return a read-only layered context for rendering without copying
+    variables. Helper functions such as now() override variables.
+    """
+    return ChainMap({'omit': omit}, template_helpers, variables, jinja2envs[template_style].globals)
+
+def evaluate_expression(expression, context):
+    """
+    Evaluate expression from compile_expression using the context mapping
+    directly rather than copying it into a new dict.
+
+    This mirrors TemplateExpression.__call__ and relies on Jinja2 internals
+    (_template, root_render_func, new_context with shared=True) as of the
+    Jinja2==3.1.4 pinned in requirements.txt. Recheck when upgrading Jinja2.
+    """
+    template = expression._template
+    j2context = template.new_context(context, shared=True)
+    for _ in template.root_render_func(j2context):
+        pass
+    return j2context.vars['result']
+
+# Value of omit when processing templates. Rendering omit to a string gives
+# the same placeholder value, so it is detected by comparison and the
+# sentinel is then used to drop the key or list item while rendering.
+omit_value = '__omit_place_holder__' + ''.join(random.choices('abcdef0123456789', k=40))
 
 def recursive_process_template_strings(template, template_style='jinja2', variables={}):
-    omit = '__omit_place_holder__' + ''.join(random.choices('abcdef0123456789', k=40))
-    return __recursive_strip_omit(
-        __recursive_process_template_strings(
-            omit = omit,
-            template = template,
-            template_style = template_style,
-            variables = variables,
-        ),
-        omit = omit,
+    return TemplateTree(template, template_style).render(variables)
+
+def is_static_template_string(template):
+    """
+    Return whether a string renders to itself. Jinja2 strips a single trailing
+    newline and normalizes line endings, so such strings are not static.
+    """
+    return not (
+        '{{' in template or
+        '{%' in template or
+        '{#' in template or
+        '\r' in template or
+        template.endswith('\n')
     )
 
-def __recursive_process_template_strings(template, omit, template_style, variables):
-    if isinstance(template, dict):
+# Variables and filters which produce a different result on each render.
+volatile_template_filters = frozenset(('random', 'strgen'))
+volatile_template_variables = frozenset(('datetime', 'lipsum', 'now', 'timestamp'))
+
+def template_fingerprint(variables, names):
+    """
+    Return a digest of the values of the named variables or None if any of
+    the values cannot be serialized. Kubernetes objects are represented by
+    their definition, ignoring resourceVersion and managedFields.
+    """
+    try:
+        data = json.dumps(
+            {name: variables[name] for name in names if name in variables},
+            default = _fingerprint_default,
+            separators = (',', ':'),
+            sort_keys = True,
+        )
+    except (TypeError, ValueError):
+        return None
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).digest()
+
+def _fingerprint_default(value):
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, tuple):
+        return list(value)
+    if hasattr(value, 'meta') and hasattr(value, 'spec') and hasattr(value, 'status'):
         return {
-            key: __recursive_process_template_strings(val, omit=omit, template_style=template_style, variables=variables)
-            for key, val in template.items()
+            "class": type(value).__name__,
+            "metadata": {
+                key: val for key, val in value.meta.items()
+                if key not in ('managedFields', 'resourceVersion')
+            },
+            "spec": value.spec,
+            "status": value.status,
         }
-    elif isinstance(template, list):
-        return [
-            __recursive_process_template_strings(item, omit=omit, template_style=template_style, variables=variables)
-            for item in template
-        ]
-    elif isinstance(template, str):
-        return jinja2process(template, omit=omit, template_style=template_style, variables=variables)
+    raise TypeError(f"Unable to fingerprint {type(value).__name__}")
+
+def copy_static_value(value):
+    if isinstance(value, dict):
+        return {key: copy_static_value(val) for key, val in value.items()}
+    elif isinstance(value, list):
+        return [copy_static_value(item) for item in value]
     else:
-        return template
+        return value
+
+class TemplateTree:
+    """
+    Precompiled skeleton of a template data structure.
 
-def __recursive_strip_omit(value, omit):
+    Strings which contain no template syntax and any dicts or lists which only
+    contain such values are marked static when the tree is built so that
+    rendering only processes dynamic strings.
+
+    With memoize enabled the variables referenced by the dynamic strings are
+    recorded and rendered output is cached keyed on a fingerprint of just
+    those variables. Callers which render for many objects, such as one
+    ResourceHandle each, pass a cache_key to keep one rendering per object.
+    Templates which use volatile variables or filters such as now() or strgen
+    are never memoized.
+
+    Use render_async() from the event loop to render large trees in the
+    template render executor.
+    """
+    def __init__(self, template, template_style='jinja2', memoize=False):
+        self.render_cache = None
+        self.referenced_variables = None
+        self.template_style = template_style
+        self.root = self.__build(template)
+        self.dynamic_count = sum(1 for _ in self.__dynamic_strings(self.root))
+        if memoize and not self.is_static:
+            self.referenced_variables = self.__find_referenced_variables()
+            if self.referenced_variables is not None:
+                self.render_cache = RenderCache(maxsize=Poolboy.template_render_cache_size)
+
+    @property
+    def is_static(self):
+        return isinstance(self.root, _StaticNode)
+
+    def __build(self, template):
+        if isinstance(template, dict):
+            items = [(key, self.__build(val)) for key, val in template.items()]
+            if all(isinstance(node, _StaticNode) for key, node in items):
+                return _StaticNode(template)
+            return _DictNode(items)
+        elif isinstance(template, list):
+            items = [self.__build(item) for item in template]
+            if all(isinstance(node, _StaticNode) for node in items):
+                return _StaticNode(template)
+            return _ListNode(items)
+        elif isinstance(template, str) and not is_static_template_string(template):
+            return _StringNode(template, self.template_style)
+        else:
+            return _StaticNode(template)
+
+    def __find_referenced_variables(self):
+        """
+        Return the sorted names of variables referenced by dynamic strings or
+        None if the templates cannot be memoized.
+        """
+        jinja2env = jinja2envs[self.template_style]
+        names = set()
+        for template in self.__dynamic_strings(self.root):
+            try:
+                ast = jinja2env.parse(template)
+            except jinja2.TemplateSyntaxError:
+                return None
+            for node in ast.find_all((jinja2.nodes.Filter, jinja2.nodes.Name)):
+                if isinstance(node, jinja2.nodes.Filter):
+                    if node.name in volatile_template_filters:
+                        return None
+                elif node.name in volatile_template_variables:
+                    return None
+            # Environment globals such as now() are not reported as undeclared
+            names.update(jinja2.meta.find_undeclared_variables(ast))
+        names.discard('omit')
+        return tuple(sorted(names))
+
+    def __dynamic_strings(self, node):
+        if isinstance(node, _DictNode):
+            for key, item in node.items:
+                yield from self.__dynamic_strings(item)
+        elif isinstance(node, _ListNode):
+            for item in node.items:
+                yield from self.__dynamic_strings(item)
+        elif isinstance(node, _StringNode):
+            yield node.template
+
+    def render(self, variables={}, cache_key=None):
+        if self.is_static:
+            return copy_static_value(self.root.value)
+        if self.render_cache is None:
+            return self.__render(variables)
+        fingerprint = template_fingerprint(variables, self.referenced_variables)
+        if fingerprint is None:
+            return self.__render(variables)
+        if cache_key is None:
+            cache_key = fingerprint
+        value = self.render_cache.get(cache_key, fingerprint)
+        if value is None:
+            value = self.__render(variables)
+            self.render_cache.put(cache_key, fingerprint, value)
+        return copy_static_value(value)
+
+    async def render_async(self, variables={}, cache_key=None):
+        return await template_render_executor.render(self, variables, cache_key)
+
+    def __render(self, variables):
+        value = self.root.render(variables)
+        if value is not omit_value:
+            return value
+
+def strip_omit(value):
+    """Remove omitted values from data produced by an object type filter."""
     if isinstance(value, dict):
         return {
-            key: __recursive_strip_omit(val, omit=omit)
-            for key, val in value.items()
-            if val != omit
+            key: strip_omit(val) for key, val in value.items() if val != omit_value
         }
     elif isinstance(value, list):
-        return [
-            __recursive_strip_omit(item, omit=omit) for item in value if item != omit
-        ]
-    elif value != omit:
+        return [strip_omit(item) for item in value if item != omit_value]
+    return value
+
+class _DictNode:
+    def __init__(self, items):
+        self.items = items
+
+    def render(self, variables):
+        ret = {}
+        for key, node in self.items:
+            value = node.render(variables)
+            if value is not omit_value:
+                ret[key] = value
+        return ret
+
+class _ListNode:
+    def __init__(self, items):
+        self.items = items
+
+    def render(self, variables):
+        ret = []
+        for node in self.items:
+            value = node.render(variables)
+            if value is not omit_value:
+                ret.append(value)
+        return ret
+
+class _StaticNode:
+    def __init__(self, value):
+        self.value = value
+
+    def render(self, variables):
+        return copy_static_value(self.value)
+
+class _StringNode:
+    def __init__(self, template, template_style):
+        self.template = template
+        self.template_style = template_style
+
+    def render(self, variables):
+        value = jinja2process(self.template, omit=omit_value, template_style=self.template_style, variables=variables)
+        if isinstance(value, str):
+            return omit_value if value == omit_value else value
+        elif isinstance(value, (dict, list)):
+            return strip_omit(value)
         return value
@@ -3,6 +3,7 @@ import jsonschema
 import kopf
 import kubernetes_asyncio
 
+from collections import ChainMap
 from copy import deepcopy
 from datetime import datetime, timezone
 from typing import List, Mapping, Optional, TypeVar, Union
@@ -11,7 +12,7 @@ from deep_merge import deep_merge
 from jsonpatch_from_diff import jsonpatch_from_diff
 from kopfobject import KopfObject
 from poolboy import Poolboy
-from poolboy_templating import recursive_process_template_strings
+from poolboy_templating import check_condition, recursive_process_template_strings
 
 import resourcehandle
 import resourcepool
@@ -380,10 +381,7 @@ class ResourceClaim(KopfObject):
             "spec": self.spec,
             "status": self.status,
         }
-        check_value = recursive_process_template_strings(
-            '{{(' + when_condition + ')|bool}}',
-            variables = vars_
-        )
+        check_value = check_condition(when_condition, variables=vars_)
         return check_value
 
     def check_auto_delete(self, logger, resource_handle, resource_provider) -> bool:
@@ -1002,7 +1000,7 @@ class ResourceClaim(KopfObject):
                     parameters_from_defaults.add(parameter.name)
                     parameter_values[parameter.name] = recursive_process_template_strings(
                         parameter.default_template,
-                        variables = { **vars_, **parameter_values }
+                        variables = ChainMap(parameter_values, vars_)
                     )
                 elif parameter.default_value != None:
                     parameters_from_defaults.add(parameter.name)
@@ -1034,9 +1032,8 @@ class ResourceClaim(KopfObject):
 
                 for validation_check in parameter.validation_checks:
                     try:
-                        check_successful = recursive_process_template_strings(
-                            '{{(' + validation_check.check + ')|bool}}',
-                            variables = { **vars_, **parameter_values, "value": value }
+                        check_successful = validation_check.condition.evaluate(
+                            ChainMap({"value": value}, parameter_values, vars_)
                         )
                         if not check_successful:
                             validation_errors.append(f"Parameter {parameter.name} failed check: {validation_check.name}")
@@ -8,7 +8,7 @@ import pytimeparse
 
 from copy import deepcopy
 from datetime import datetime, timedelta, timezone
-from typing import Any, List, Mapping, Optional, TypeVar, Union
+from typing import Any, List, Mapping, Optional, Tuple, TypeVar, Union
 
 import poolboy_k8s
 import resourceclaim
@@ -79,7 +79,13 @@ class ResourceHandle(KopfObject):
     all_instances = {}
     bound_instances = {}
     unbound_instances = {}
+    # Map of (apiVersion, kind, namespace, name) of managed resources to
+    # (ResourceHandle name, resource index)
+    resource_reference_index = {}
+    # Count of references to managed resources by (apiVersion, kind, namespace)
+    resource_reference_counts = {}
     class_lock = asyncio.Lock()
+    update_status_all_task = None
 
     @classmethod
     def __register_definition(cls, definition: Mapping) -> ResourceHandleT:
@@ -559,6 +565,23 @@ class ResourceHandle(KopfObject):
             resource_handle.__register()
             return resource_handle
 
+    @classmethod
+    def count_resource_references(cls,
+        api_version: str,
+        kind: str,
+        namespace: Optional[str] = None,
+    ) -> int:
+        """
+        Return number of references from ResourceHandles to resources of kind
+        in namespace or in any namespace if namespace is not given.
+        """
+        if namespace:
+            return cls.resource_reference_counts.get((api_version, kind, namespace), 0)
+        return sum(
+            count for (count_api_version, count_kind, count_namespace), count in cls.resource_reference_counts.items()
+            if count_api_version == api_version and count_kind == kind
+        )
+
     @classmethod
     async def register_definition(cls, definition: Mapping) -> ResourceHandleT:
         async with cls.class_lock:
@@ -591,10 +614,47 @@ class ResourceHandle(KopfObject):
         self.spec = spec
         self.status = status
         self.uid = uid
+        self.indexed_resource_references = []
 
     def __str__(self) -> str:
         return f"ResourceHandle {self.name}"
 
+    def __index_resource_references(self) -> None:
+        """Update resource_reference_index for references to managed resources."""
+        resource_references = []
+        if not self.is_deleting:
+            for resource_index, resource in enumerate(self.resources):
+                reference = None
+                if resource_index < len(self.status_resources):
+                    reference = self.status_resources[resource_index].get('reference')
+                if not reference:
+                    reference = resource.get('reference')
+                if reference:
+                    resource_references.append((
+                        (reference['apiVersion'], reference['kind'], reference.get('namespace'), reference['name']),
+                        resource_index,
+                    ))
+        if resource_references == self.indexed_resource_references:
+            return
+        self.__unindex_resource_references()
+        for key, resource_index in resource_references:
+            self.resource_reference_index[key] = (self.name, resource_index)
+            count_key = key[:3]
+            self.resource_reference_counts[count_key] = self.resource_reference_counts.get(count_key, 0) + 1
+        self.indexed_resource_references = resource_references
+
+    def __unindex_resource_references(self) -> None:
+        for key, resource_index in self.indexed_resource_references:
+            if self.resource_reference_index.get(key) == (self.name, resource_index):
+                del self.resource_reference_index[key]
+            count_key = key[:3]
+            count = self.resource_reference_counts.get(count_key, 0) - 1
+            if count > 0:
+                self.resource_reference_counts[count_key] = count
+            else:
+                self.resource_reference_counts.pop(count_key, None)
+        self.indexed_resource_references = []
+
     def __register(self) -> None:
         """
         Add ResourceHandle to register of bound or unbound instances.
@@ -605,6 +665,7 @@ class ResourceHandle(KopfObject):
             self.__unregister()
             return
         self.all_instances[self.name] = self
+        self.__index_resource_references()
         if self.is_bound:
             self.bound_instances[(
                 self.resource_claim_namespace,
@@ -617,12 +678,23 @@ class ResourceHandle(KopfObject):
     def __unregister(self) -> None:
         self.all_instances.pop(self.name, None)
         self.unbound_instances.pop(self.name, None)
+        self.__unindex_resource_references()
         if self.is_bound:
             self.bound_instances.pop(
                 (self.resource_claim_namespace, self.resource_claim_name),
                 None,
             )
 
+    def refresh(self, **kwargs) -> None:
+        super().refresh(**kwargs)
+        if self.all_instances.get(self.name) is self:
+            self.__index_resource_references()
+
+    def refresh_from_definition(self, definition: Mapping) -> None:
+        super().refresh_from_definition(definition)
+        if self.all_instances.get(self.name) is self:
+            self.__index_resource_references()
+
     @property
     def guid(self) -> str:
         name = self.name
@@ -831,29 +903,40 @@ class ResourceHandle(KopfObject):
         return resource_providers
 
     async def get_resource_states(self, logger: kopf.ObjectLogger) -> List[Mapping]:
-        resource_states = []
-        for resource_index, resource in enumerate(self.resources):
-            if resource_index >= len(self.status_resources):
-                resource_states.append(None)
-                continue
-            reference = self.status_resources[resource_index].get('reference')
-            if not reference:
-                resource_states.append(None)
-                continue
-            api_version = reference['apiVersion']
-            kind = reference['kind']
-            name = reference['name']
-            namespace = reference.get('namespace')
-            resource = await resourcewatcher.ResourceWatcher.get_resource(
-                api_version=api_version, kind=kind, name=name, namespace=namespace,
-            )
-            resource_states.append(resource)
-            if not resource:
-                if namespace:
-                    logger.warning(f"Mangaged resource {api_version} {kind} {name} in {namespace} not found.")
-                else:
-                    logger.warning(f"Mangaged resource {api_version} {kind} {name} not found.")
-        return resource_states
+        references = [
+            self.status_resources[resource_index].get('reference')
+            if resource_index < len(self.status_resources) else None
+            for resource_index in range(len(self.resources))
+        ]
+        return list(await asyncio.gather(*[
+            self.__get_resource_state(logger=logger, reference=reference)
+            for reference in references
+        ]))
+
+    async def __get_resource_state(self,
+        logger: kopf.ObjectLogger,
+        reference: Optional[Mapping],
+    ) -> Optional[Mapping]:
+        if not reference:
+            return None
+        api_version = reference['apiVersion']
+        kind = reference['kind']
+        name = reference['name']
+        namespace = reference.get('namespace')
+        # Wait for watch cache to fill rather than fetching each resource
+        resource_watcher = await resourcewatcher.ResourceWatcher.start_resource_watch(
+            api_version=api_version, kind=kind, namespace=namespace,
+        )
+        await resource_watcher.wait_synced(timeout=Poolboy.resource_watch_sync_timeout)
+        resource = await resourcewatcher.ResourceWatcher.get_resource(
+            api_version=api_version, kind=kind, name=name, namespace=namespace,
+        )
+        if not resource:
+            if namespace:
+                logger.warning(f"Mangaged resource {api_version} {kind} {name} in {namespace} not found.")
+            else:
+                logger.warning(f"Mangaged resource {api_version} {kind} {name} not found.")
+        return resource
 
     async def handle_delete(self, logger: kopf.ObjectLogger) -> None:
         for resource in self.spec.get('resources', []):
@@ -1119,7 +1202,7 @@ class ResourceHandle(KopfObject):
                     if changes:
                         logger.info(f"Updated {resource_description} for ResourceHandle {self.name}")
                 else:
-                    resources_to_create.append(resource_definition)
+                    resources_to_create.append((resource_provider, resource_definition))
 
             if patch:
                 try:
@@ -1145,8 +1228,8 @@ class ResourceHandle(KopfObject):
                     resource_handle=self,
                 )
 
-            for resource_definition in resources_to_create:
-                changes = await poolboy_k8s.create_object(resource_definition)
+            for resource_provider, resource_definition in resources_to_create:
+                changes = await resource_provider.create_resource(resource_definition)
                 if changes:
                     logger.info(f"Created {resource_description} for ResourceHandle {self.name}")
 
@@ -1223,8 +1306,106 @@ class ResourceHandle(KopfObject):
             await self.json_patch(patch)
             logger.info(f"Updated resources for {self} from {provider}")
 
+    @classmethod
+    async def __evaluate_resource_checks(cls,
+        logger: kopf.ObjectLogger,
+        handle_resource_states: List[Tuple[ResourceHandleT, List[Optional[Mapping]]]],
+        return_exceptions: bool = False,
+    ) -> List[Union[List[Tuple[Optional[bool], Optional[bool]]], Exception]]:
+        """
+        Evaluate health and readiness checks for resources of many
+        ResourceHandles with one batch for each ResourceProvider.
+        Returns (healthy, ready) for each resource of each handle. With
+        return_exceptions a failure to get a ResourceProvider is returned in
+        place of the checks of each handle with resources from it.
+        """
+        resource_checks = []
+        batches = {}
+        for handle_index, (resource_handle, resource_states) in enumerate(handle_resource_states):
+            resource_checks.append([(None, False)] * len(resource_states))
+            for resource_index, resource_state in enumerate(resource_states):
+                if resource_state and resource_index < len(resource_handle.resources):
+                    provider_name = resource_handle.resources[resource_index]['provider']['name']
+                    batches.setdefault(provider_name, []).append(
+                        (handle_index, resource_index, resource_handle, resource_state)
+                    )
+        for provider_name, batch in batches.items():
+            try:
+                resource_provider = await resourceprovider.ResourceProvider.get(provider_name)
+            except Exception as exception:
+                if not return_exceptions:
+                    raise
+                for handle_index, _, _, _ in batch:
+                    resource_checks[handle_index] = exception
+                continue
+            checks = resource_provider.evaluate_checks_many(
+                logger = logger,
+                resource_states = [
+                    (resource_handle, resource_state) for _, _, resource_handle, resource_state in batch
+                ],
+            )
+            for (handle_index, resource_index, _, _), check in zip(batch, checks):
+                if not isinstance(resource_checks[handle_index], Exception):
+                    resource_checks[handle_index][resource_index] = check
+        return resource_checks
+
+    @classmethod
+    async def update_status_all(cls, logger: kopf.ObjectLogger, batch_size: int = 100) -> None:
+        """
+        Update status of all ResourceHandles, such as to resync after restart,
+        evaluating checks across handles in batches.
+        """
+        resource_handles = list(cls.all_instances.values())
+        for i in range(0, len(resource_handles), batch_size):
+            batch = []
+            all_resource_states = []
+            batch_handles = resource_handles[i:i + batch_size]
+            for resource_handle, resource_states in zip(
+                batch_handles,
+                await asyncio.gather(*[
+                    resource_handle.get_resource_states(logger=logger) for resource_handle in batch_handles
+                ], return_exceptions=True),
+            ):
+                if isinstance(resource_states, Exception):
+                    logger.error(f"Failed to get resource states for {resource_handle}: {resource_states}")
+                    continue
+                batch.append(resource_handle)
+                all_resource_states.append(resource_states)
+            all_resource_checks = await cls.__evaluate_resource_checks(
+                logger = logger,
+                handle_resource_states = list(zip(batch, all_resource_states)),
+                return_exceptions = True,
+            )
+            for resource_handle, resource_states, resource_checks in zip(
+                batch, all_resource_states, all_resource_checks
+            ):
+                if isinstance(resource_checks, Exception):
+                    logger.error(f"Failed to evaluate checks for {resource_handle}: {resource_checks}")
+                    continue
+                try:
+                    async with resource_handle.lock:
+                        if resource_handle.is_deleting:
+                            continue
+                        # Resources may have changed while checks were evaluated
+                        current_resource_states = await resource_handle.get_resource_states(logger=logger)
+                        if current_resource_states != resource_states:
+                            await resource_handle.update_status(
+                                logger = logger,
+                                resource_states = current_resource_states,
+                            )
+                        else:
+                            await resource_handle.update_status(
+                                logger = logger,
+                                resource_checks = resource_checks,
+                                resource_states = resource_states,
+                            )
+                except Exception:
+                    logger.exception(f"Failed to update status for {resource_handle}")
+
     async def update_status(self,
         logger: kopf.ObjectLogger,
+        resource_checks: Optional[List[Tuple[Optional[bool], Optional[bool]]]] = None,
+        resource_states: Optional[List[Optional[Mapping]]] = None,
     ) -> None:
         patch = []
         if not self.status:
@@ -1241,7 +1422,8 @@ class ResourceHandle(KopfObject):
             })
 
         resources = deepcopy(self.resources)
-        resource_states = await self.get_resource_states(logger=logger)
+        if resource_states is None:
+            resource_states = await self.get_resource_states(logger=logger)
         for idx, state in enumerate(resource_states):
             resources[idx]['state'] = state
             if len(self.status_resources) < idx:
@@ -1254,25 +1436,14 @@ class ResourceHandle(KopfObject):
         overall_ready = True
         overall_healthy = True
 
+        if resource_checks is None:
+            resource_checks = (await self.__evaluate_resource_checks(
+                logger = logger,
+                handle_resource_states = [(self, resource_states)],
+            ))[0]
+
         for idx, resource in enumerate(resources):
-            if resource['state']:
-                resource_provider = await resourceprovider.ResourceProvider.get(resource['provider']['name'])
-                resource_healthy = resource_provider.check_health(
-                    logger = logger,
-                    resource_handle = self,
-                    resource_state = resource['state'],
-                )
-                if resource_healthy == False:
-                    resource_ready = False
-                else:
-                    resource_ready = resource_provider.check_readiness(
-                        logger = logger,
-                        resource_handle = self,
-                        resource_state = resource['state'],
-                    )
-            else:
-                resource_healthy = None
-                resource_ready = False
+            resource_healthy, resource_ready = resource_checks[idx]
 
             # If the resource is not healthy then it is overall unhealthy.
             # If the resource health is unknown then he overall health is unknown unless it is unhealthy.
@@ -1357,7 +1528,7 @@ class ResourceHandle(KopfObject):
             resource_provider = await self.get_resource_provider()
             if resource_provider.status_summary_template:
                 try:
-                    status_summary = resource_provider.make_status_summary(
+                    status_summary = await resource_provider.make_status_summary(
                         resource_handle=self,
                         resources=resources,
                     )
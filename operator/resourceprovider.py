@@ -2,21 +2,24 @@ import asyncio
 import jinja2
 import jsonpointer
 import kopf
+import kubernetes_asyncio
 import pytimeparse
 import re
 
+from collections import ChainMap
 from copy import deepcopy
 from datetime import timedelta
 from openapi_schema_validator import OAS30Validator
 from openapi_schema_util import defaults_from_schema
-from typing import List, Mapping, Optional, TypeVar
+from typing import FrozenSet, List, Mapping, Optional, Tuple, TypeVar, Union
 
 import poolboy_k8s
+import resourcewatcher
 
 from deep_merge import deep_merge
-from jsonpatch_from_diff import jsonpatch_from_diff
+from jsonpatch_from_diff import filter_definition, jsonpatch_from_diff
 from poolboy import Poolboy
-from poolboy_templating import check_condition, recursive_process_template_strings
+from poolboy_templating import CompiledCondition, TemplateTree, is_static_template_string, recursive_process_template_strings
 
 ResourceClaimT = TypeVar('ResourceClaimT', bound='ResourceClaim')
 ResourceHandleT = TypeVar('ResourceHandleT', bound='ResourceHandle')
@@ -24,12 +27,14 @@ ResourceProviderT = TypeVar('ResourceProviderT', bound='ResourceProvider')
 
 
 class _LinkedResourceProvider:
-    def __init__(self, spec):
+    def __init__(self, spec, template_style='jinja2'):
         self.name = spec['name']
         self.parameter_values = spec.get('parameterValues', {})
         self.resource_name = spec.get('resourceName', self.name)
         self.wait_for = spec.get('waitFor')
+        self.wait_for_condition = CompiledCondition(self.wait_for, template_style) if self.wait_for else None
         self.when = spec.get('when')
+        self.when_condition = CompiledCondition(self.when, template_style) if self.when else None
         self.template_vars = [
             _TemplateVar(item) for item in spec.get('templateVars', [])
         ]
@@ -52,9 +57,7 @@ class _LinkedResourceProvider:
             # No linked resource state, so definitely wait
             return False
 
-        vars_ = {
-            **resource_provider.vars,
-            **resource_handle.vars,
+        bindings = {
             'linked_resource_provider': linked_resource_provider,
             'linked_resource_state': linked_resource_state,
             'resource_claim': resource_claim,
@@ -64,13 +67,13 @@ class _LinkedResourceProvider:
         }
 
         for template_var in self.template_vars:
-            vars_[template_var.name] = jsonpointer.resolve_pointer(
+            bindings[template_var.name] = jsonpointer.resolve_pointer(
                 linked_resource_state, template_var.value_from,
                 default = jinja2.ChainableUndefined()
             )
 
-        return recursive_process_template_strings(
-            '{{(' + self.wait_for + ')|bool}}', resource_provider.template_style, vars_
+        return self.wait_for_condition.evaluate(
+            ChainMap(bindings, resource_handle.vars, resource_provider.vars)
         )
 
     def check_when(self,
@@ -91,27 +94,29 @@ class _LinkedResourceProvider:
 
         resource_handle_vars = resource_handle.vars if resource_handle else {}
 
-        return recursive_process_template_strings(
-            '{{(' + self.when + ')|bool}}', resource_provider.template_style, {
-                **resource_provider.vars,
-                **resource_handle_vars,
-                **parameter_values,
-                "resource_claim": resource_claim,
-                "resource_handle": resource_handle,
-                "resource_provider": self,
-            }
+        return self.when_condition.evaluate(
+            ChainMap(
+                {
+                    "resource_claim": resource_claim,
+                    "resource_handle": resource_handle,
+                    "resource_provider": self,
+                },
+                parameter_values,
+                resource_handle_vars,
+                resource_provider.vars,
+            )
         )
 
 
 class _Parameter:
-    def __init__(self, definition):
+    def __init__(self, definition, template_style='jinja2'):
         self.allow_update = definition.get('allowUpdate', False)
         self.name = definition['name']
         self.required = definition.get('required', False)
 
         validation = definition.get('validation', {})
         self.validation_checks = [
-            _ParameterValidationCheck(**check) for check in validation.get('checks', [])
+            _ValidationCheck(**check, template_style=template_style) for check in validation.get('checks', [])
         ]
 
         default = definition.get('default', {})
@@ -128,9 +133,10 @@ class _Parameter:
             self.open_api_v3_schema_validator = None
 
 
-class _ParameterValidationCheck:
-    def __init__(self, check: str, name: str):
+class _ValidationCheck:
+    def __init__(self, check: str, name: str, template_style: str='jinja2'):
         self.check = check
+        self.condition = CompiledCondition(check, template_style)
         self.name = name
 
 
@@ -153,13 +159,31 @@ class ResourceProvider:
         name = definition['metadata']['name']
         resource_provider = cls.instances.get(name)
         if resource_provider:
-            resource_provider.definition = definition
-            self.__init_resource_template_validator()
+            resource_provider.__init__(definition=definition)
         else:
             resource_provider = cls(definition=definition)
             cls.instances[name] = resource_provider
+        resourcewatcher.ResourceWatcher.refresh_all_status_paths()
         return resource_provider
 
+    @classmethod
+    def get_resource_status_paths(cls, api_version: str, kind: str) -> Optional[FrozenSet[str]]:
+        """
+        Return the union of resourceStatusPaths of all ResourceProviders which
+        may create resources of kind, or None if the full status is needed
+        because any of them does not declare status paths.
+        """
+        status_paths = set()
+        provider_found = False
+        for provider in cls.instances.values():
+            if not provider.may_create_kind(api_version=api_version, kind=kind):
+                continue
+            if provider.resource_status_paths is None:
+                return None
+            provider_found = True
+            status_paths.update(provider.resource_status_paths)
+        return frozenset(status_paths) if provider_found else None
+
     @classmethod
     def find_provider_by_template_match(cls, template: Mapping) -> ResourceProviderT:
         provider_matches = []
@@ -214,6 +238,7 @@ class ResourceProvider:
             resource_provider = cls.instances.get(name)
             if resource_provider:
                 resource_provider.__init__(definition=definition)
+                resourcewatcher.ResourceWatcher.refresh_all_status_paths()
                 logger.info(f"Refreshed definition of ResourceProvider {name}")
             else:
                 resource_provider = cls.__register_definition(definition=definition)
@@ -225,12 +250,16 @@ class ResourceProvider:
         async with cls.lock:
             if name in cls.instances:
                 logger.info(f"Unregistered ResourceProvider {name}")
-                return cls.instances.pop(name)
+                resource_provider = cls.instances.pop(name)
+                resourcewatcher.ResourceWatcher.refresh_all_status_paths()
+                return resource_provider
 
     def __init__(self, definition: Mapping) -> None:
         self.meta = definition['metadata']
         self.spec = definition['spec']
         self.__init_resource_template_validator()
+        self.__init_template_trees()
+        self.__init_conditions()
 
     def __init_resource_template_validator(self) -> None:
         open_api_v3_schema = self.spec.get('validation', {}).get('openAPIV3Schema', None)
@@ -239,6 +268,42 @@ class ResourceProvider:
         else:
             self.resource_template_validator = None
 
+    def __init_conditions(self) -> None:
+        """
+        Compile conditions once per definition rather than on every check.
+        """
+        self.health_check_condition = (
+            CompiledCondition(self.spec['healthCheck'], self.template_style)
+            if 'healthCheck' in self.spec else None
+        )
+        self.readiness_check_condition = (
+            CompiledCondition(self.spec['readinessCheck'], self.template_style)
+            if 'readinessCheck' in self.spec else None
+        )
+        self.linked_resource_providers = [
+            _LinkedResourceProvider(item, self.template_style)
+            for item in self.spec.get('linkedResourceProviders', [])
+        ]
+        self.parameters = [
+            _Parameter(pd, self.template_style) for pd in self.spec.get('parameters', [])
+        ]
+        self.resource_validation_checks = [
+            _ValidationCheck(**check, template_style=self.template_style)
+            for check in self.validation_checks
+        ]
+
+    def __init_template_trees(self) -> None:
+        """
+        Build template skeletons once per definition so that rendering only
+        needs to process the dynamic strings in each template.
+        """
+        self.default_template_tree = TemplateTree(self.spec.get('default', {}), self.template_style)
+        self.override_template_tree = TemplateTree(self.override, self.template_style, memoize=True)
+        self.processed_template_tree = TemplateTree(
+            self.spec.get('template', {}).get('definition', {}), self.template_style, memoize=True
+        )
+        self.status_summary_template_tree = TemplateTree(self.status_summary_template, self.template_style)
+
     def __str__(self) -> str:
         return f"ResourceProvider {self.name}"
 
@@ -292,12 +357,6 @@ class ResourceProvider:
         if seconds:
             return timedelta(seconds=seconds)
 
-    @property
-    def linked_resource_providers(self) -> List[ResourceProviderT]:
-        return [
-            _LinkedResourceProvider(item) for item in self.spec.get('linkedResourceProviders', [])
-        ]
-
     @property
     def match(self):
         return self.spec.get('match', None)
@@ -346,6 +405,14 @@ class ResourceProvider:
     def resource_requires_claim(self) -> bool:
         return self.spec.get('resourceRequiresClaim', False)
 
+    @property
+    def server_side_apply(self) -> bool:
+        return self.spec.get('serverSideApply', False)
+
+    @property
+    def server_side_apply_force(self) -> bool:
+        return self.spec.get('serverSideApplyForce', False)
+
     @property
     def status_summary_template(self) -> Optional[Mapping]:
         return self.spec.get('statusSummaryTemplate')
@@ -362,6 +429,10 @@ class ResourceProvider:
     def vars(self) -> Mapping:
         return self.spec.get('vars', {})
 
+    @property
+    def resource_status_paths(self) -> Optional[List[str]]:
+        return self.spec.get('resourceStatusPaths')
+
     @property
     def update_filters(self):
         return self.spec.get('updateFilters', [])
@@ -402,9 +473,7 @@ class ResourceProvider:
             if self.template_enable:
                 deep_merge(
                     template,
-                    recursive_process_template_strings(
-                        template = self.spec['default'],
-                        template_style = self.template_style,
+                    self.default_template_tree.render(
                         variables = {
                             "resource_claim": resource_claim,
                             "resource_index": resource_index,
@@ -436,15 +505,11 @@ class ResourceProvider:
         resource_handle: ResourceHandleT,
         resource_state: Mapping,
     ) -> Optional[bool]:
-        if 'healthCheck' not in self.spec:
+        if not self.health_check_condition:
             return None
         try:
-            return check_condition(
-                condition = self.spec['healthCheck'],
-                variables = {
-                    **resource_state,
-                    "resource_handle": resource_handle,
-                },
+            return self.health_check_condition.evaluate(
+                ChainMap({"resource_handle": resource_handle}, resource_state)
             )
         except Exception:
             logger.exception("Failed health check on {resource_handle} with {self}")
@@ -455,20 +520,60 @@ class ResourceProvider:
         resource_handle: ResourceHandleT,
         resource_state: Mapping,
     ) -> Optional[bool]:
-        if 'readinessCheck' not in self.spec:
+        if not self.readiness_check_condition:
             return None
         try:
-            return check_condition(
-                condition = self.spec['readinessCheck'],
-                variables = {
-                    **resource_state,
-                    "resource_handle": resource_handle,
-                },
+            return self.readiness_check_condition.evaluate(
+                ChainMap({"resource_handle": resource_handle}, resource_state)
             )
         except Exception:
             logger.exception("Failed readiness check on {resource_handle} with {self}")
             return None
 
+    def evaluate_checks_many(self,
+        logger: kopf.ObjectLogger,
+        resource_states: List[Tuple[ResourceHandleT, Mapping]],
+    ) -> List[Tuple[Optional[bool], Optional[bool]]]:
+        """
+        Evaluate health and readiness checks for a list of ResourceHandle and
+        resource state pairs in one pass.
+        Returns a (healthy, ready) tuple for each item. A resource which fails
+        its health check is never ready.
+        """
+        variables_list = [
+            ChainMap({"resource_handle": resource_handle}, resource_state)
+            for resource_handle, resource_state in resource_states
+        ]
+
+        if self.health_check_condition:
+            health_results = self.health_check_condition.evaluate_many(variables_list)
+        else:
+            health_results = [None] * len(variables_list)
+
+        if self.readiness_check_condition:
+            readiness_results = self.readiness_check_condition.evaluate_many([
+                variables for variables, healthy in zip(variables_list, health_results)
+                if healthy != False
+            ])
+        else:
+            readiness_results = []
+
+        ret = []
+        readiness_results = iter(readiness_results)
+        for (resource_handle, resource_state), healthy in zip(resource_states, health_results):
+            if isinstance(healthy, Exception):
+                logger.error(f"Failed health check on {resource_handle} with {self}", exc_info=healthy)
+                healthy = None
+            if healthy == False:
+                ret.append((False, False))
+                continue
+            ready = next(readiness_results, None)
+            if isinstance(ready, Exception):
+                logger.error(f"Failed readiness check on {resource_handle} with {self}", exc_info=ready)
+                ready = None
+            ret.append((healthy, ready))
+        return ret
+
     def check_template_match(self,
         claim_resource_template: Mapping,
         handle_resource_template: Mapping,
@@ -503,9 +608,7 @@ class ResourceProvider:
         return self.__lifespan_value_as_timedelta('relativeMaximum', resource_claim)
 
     def get_parameters(self) -> List[_Parameter]:
-        return [
-            _Parameter(pd) for pd in self.spec.get('parameters', [])
-        ]
+        return self.parameters
 
     async def get_resources(self,
         parameter_values: Optional[Mapping] = None,
@@ -530,14 +633,16 @@ class ResourceProvider:
             }
 
         resource_handle_vars = resource_handle.vars if resource_handle else {}
-        vars_ = {
-            **self.vars,
-            **resource_handle_vars,
-            **parameter_values,
-            "resource_claim": resource_claim,
-            "resource_handle": resource_handle,
-            "resource_provider": self,
-        }
+        vars_ = ChainMap(
+            {
+                "resource_claim": resource_claim,
+                "resource_handle": resource_handle,
+                "resource_provider": self,
+            },
+            parameter_values,
+            resource_handle_vars,
+            self.vars,
+        )
 
         resources = []
         for linked_resource_provider in self.linked_resource_providers:
@@ -565,7 +670,7 @@ class ResourceProvider:
             resources.append({
                 "name": resource_name or self.resource_name,
                 "provider": self.as_reference(),
-                "template": self.processed_template(
+                "template": await self.processed_template(
                     parameter_values = parameter_values,
                     resource_claim = resource_claim,
                     resource_handle = resource_handle,
@@ -574,6 +679,22 @@ class ResourceProvider:
 
         return resources
 
+    def may_create_kind(self, api_version: str, kind: str) -> bool:
+        """
+        Check whether resources created by this provider may be of kind. Only
+        literal apiVersion and kind in the override rule out a kind, otherwise
+        they may come from the resource template.
+        """
+        for key, value in (('apiVersion', api_version), ('kind', kind)):
+            override_value = self.override.get(key)
+            if not isinstance(override_value, str):
+                continue
+            if self.template_enable and not is_static_template_string(override_value):
+                continue
+            if override_value != value:
+                return False
+        return True
+
     def is_match_for_template(self, template: Mapping) -> bool:
         """
         Check if this provider is a match for the resource template by checking
@@ -585,42 +706,47 @@ class ResourceProvider:
         deep_merge(cmp_template, self.match)
         return template == cmp_template
 
-    def make_status_summary(self,
+    async def make_status_summary(self,
         resource_claim: Optional[ResourceClaimT] = None,
         resource_handle: Optional[ResourceHandleT] = None,
         resources: List[Mapping] = [],
     ) -> Mapping:
-        variables = {**self.vars}
-        if resource_claim:
-            variables.update(resource_claim.parameter_values)
-        else:
-            variables.update(resource_handle.parameter_values)
-
-        variables['resource_claim'] = resource_claim
-        variables['resource_handle'] = resource_handle
-        variables['resources'] = resources
-
-        return recursive_process_template_strings(
-            self.status_summary_template,
-            variables = variables,
+        return await self.status_summary_template_tree.render_async(
+            ChainMap(
+                {
+                    "resource_claim": resource_claim,
+                    "resource_handle": resource_handle,
+                    "resources": resources,
+                },
+                resource_claim.parameter_values if resource_claim else resource_handle.parameter_values,
+                self.vars,
+            )
         )
 
-    def processed_template(self,
+    async def processed_template(self,
         parameter_values: Mapping,
         resource_claim: ResourceClaimT,
         resource_handle: Optional[ResourceHandleT],
     ) -> Mapping:
         resource_handle_vars = resource_handle.vars if resource_handle else {}
-        return recursive_process_template_strings(
-            self.spec.get('template', {}).get('definition', {}),
-            variables = {
-                **self.vars,
-                **resource_handle_vars,
-                **parameter_values,
-                "resource_claim": resource_claim,
-                "resource_handle": resource_handle,
-                "resource_provider": self,
-            }
+        if resource_handle:
+            cache_key = ('ResourceHandle', resource_handle.name)
+        elif resource_claim:
+            cache_key = ('ResourceClaim', resource_claim.namespace, resource_claim.name)
+        else:
+            cache_key = None
+        return await self.processed_template_tree.render_async(
+            cache_key = cache_key,
+            variables = ChainMap(
+                {
+                    "resource_claim": resource_claim,
+                    "resource_handle": resource_handle,
+                    "resource_provider": self,
+                },
+                parameter_values,
+                resource_handle_vars,
+                self.vars,
+            )
         )
 
     def validate_resource_template(self,
@@ -632,20 +758,20 @@ class ResourceProvider:
             self.resource_template_validator.validate(template)
 
         resource_handle_vars = resource_handle.vars if resource_handle else {}
-        vars_ = {
-            **self.vars,
-            **resource_handle_vars,
-            "resource_claim": resource_claim,
-            "resource_handle": resource_handle,
-            "resource_provider": self,
-            **template,
-        }
-        for check in self.validation_checks:
-            name = check['name']
+        vars_ = ChainMap(
+            template,
+            {
+                "resource_claim": resource_claim,
+                "resource_handle": resource_handle,
+                "resource_provider": self,
+            },
+            resource_handle_vars,
+            self.vars,
+        )
+        for check in self.resource_validation_checks:
+            name = check.name
             try:
-                check_successful = recursive_process_template_strings(
-                    '{{(' + check['check'] + ')|bool}}', variables=vars_
-                )
+                check_successful = check.condition.evaluate(vars_)
                 if not check_successful:
                     raise _ValidationException(f"Validation check failed: {name}")
             except _ValidationException:
@@ -678,11 +804,7 @@ class ResourceProvider:
         resource_definition = deepcopy(resource_template)
         if 'override' in self.spec:
             if self.template_enable:
-                all_vars = {
-                    **self.vars,
-                    **vars_,
-                }
-                all_vars.update({
+                all_vars = ChainMap({
                     "guid": resource_handle.guid,
                     "requester_identities": requester_identities,
                     "requester_identity": requester_identity,
@@ -698,11 +820,12 @@ class ResourceProvider:
                     "resource_states": resource_states,
                     "resource_template": resource_templates[resource_index],
                     "resource_templates": resource_templates,
-                })
+                }, vars_, self.vars)
                 deep_merge(
                     resource_definition,
-                    recursive_process_template_strings(
-                        self.override, self.template_style, all_vars
+                    await self.override_template_tree.render_async(
+                        all_vars,
+                        cache_key = (resource_handle.name, resource_index),
                     )
                 )
             else:
@@ -743,6 +866,11 @@ class ResourceProvider:
 
         if 'annotations' not in resource_definition['metadata']:
             resource_definition['metadata']['annotations'] = {}
+        if 'labels' not in resource_definition['metadata']:
+            resource_definition['metadata']['labels'] = {}
+
+        # Label allows watches to select only resources managed by Poolboy
+        resource_definition['metadata']['labels'][Poolboy.managed_label] = 'true'
 
         resource_definition['metadata']['annotations'].update({
             f"{Poolboy.operator_domain}/resource-provider-name": self.name,
@@ -779,22 +907,91 @@ class ResourceProvider:
 
         return resource_definition
 
+    async def create_resource(self, resource_definition: Mapping) -> Mapping:
+        """
+        Create resource from definition. With server-side apply the resource
+        is created by apply so that the Poolboy field manager owns its fields
+        and later applies do not conflict with the create.
+        """
+        if self.server_side_apply:
+            return await poolboy_k8s.apply_object(resource_definition, force=self.server_side_apply_force)
+        return await poolboy_k8s.create_object(resource_definition)
+
     async def update_resource(self,
         logger: kopf.ObjectLogger,
         resource_definition: Mapping,
         resource_handle: ResourceHandleT,
         resource_state: Mapping,
-    ) -> Optional[List]:
+    ) -> Union[List, Mapping, None]:
+        """
+        Update resource to match definition. Returns the JSON patch applied or,
+        with server-side apply, the updated resource if it changed.
+        """
         update_filters = self.update_filters + [{
             'pathMatch': f"/metadata/annotations/{re.escape(Poolboy.operator_domain)}~1resource-.*"
         }]
         patch = jsonpatch_from_diff(resource_state, resource_definition, update_filters=update_filters)
-        if patch:
-            await poolboy_k8s.patch_object(
-                api_version = resource_definition['apiVersion'],
-                kind = resource_definition['kind'],
-                name = resource_definition['metadata']['name'],
-                namespace = resource_definition['metadata'].get('namespace'),
-                patch = patch,
-            )
-            return patch
+
+        # Add managed label to resources created before it was applied unless
+        # the patch already sets it along with labels from the template.
+        resource_labels = resource_state['metadata'].get('labels')
+        patch_paths = set(item['path'] for item in patch)
+        if resource_labels is None:
+            if '/metadata/labels' not in patch_paths:
+                patch.append({
+                    "op": "add",
+                    "path": "/metadata/labels",
+                    "value": {Poolboy.managed_label: 'true'},
+                })
+        elif resource_labels.get(Poolboy.managed_label) != 'true':
+            managed_label_path = '/metadata/labels/' + Poolboy.managed_label.replace('~', '~0').replace('/', '~1')
+            if managed_label_path not in patch_paths:
+                patch.append({
+                    "op": "add",
+                    "path": managed_label_path,
+                    "value": 'true',
+                })
+
+        if not patch:
+            return None
+
+        if self.server_side_apply:
+            # Fields are removed by omitting them from the applied definition
+            # so removals alone do not require an update.
+            if all(item['op'] == 'remove' for item in patch):
+                return None
+            # Apply only fields which update filters allow so that values
+            # which must not change after creation are not overwritten.
+            apply_definition = filter_definition(resource_definition, resource_state, update_filters)
+            apply_definition['apiVersion'] = resource_definition['apiVersion']
+            apply_definition['kind'] = resource_definition['kind']
+            apply_metadata = apply_definition.setdefault('metadata', {})
+            apply_metadata['name'] = resource_definition['metadata']['name']
+            if 'namespace' in resource_definition['metadata']:
+                apply_metadata['namespace'] = resource_definition['metadata']['namespace']
+            apply_metadata.setdefault('labels', {})[Poolboy.managed_label] = 'true'
+            try:
+                resource = await poolboy_k8s.apply_object(apply_definition, force=self.server_side_apply_force)
+            except kubernetes_asyncio.client.exceptions.ApiException as exception:
+                if exception.status != 409:
+                    raise
+                body = exception.body
+                if isinstance(body, bytes):
+                    body = body.decode('utf-8', errors='replace')
+                raise kopf.TemporaryError(
+                    f"Server-side apply conflict for {resource_definition['kind']} "
+                    f"{resource_definition['metadata']['name']}: {body}",
+                    delay = 60
+                )
+            if resource['metadata']['resourceVersion'] != resource_state['metadata'].get('resourceVersion'):
+                return resource
+            return None
+
+        await poolboy_k8s.patch_object(
+            api_version = resource_definition['apiVersion'],
+            kind = resource_definition['kind'],
+            name = resource_definition['metadata']['name'],
+            namespace = resource_definition['metadata'].get('namespace'),
+            patch = patch,
+        )
+        return patch
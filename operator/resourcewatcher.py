@@ -1,15 +1,20 @@
 import asyncio
-import inflection
+import hashlib
+import json
+import jsonpointer
 import kubernetes_asyncio
 import logging
+import time
 
 from datetime import datetime, timezone
-from typing import Mapping, Optional, TypeVar
+from typing import FrozenSet, List, Mapping, Optional, TypeVar
 
 import poolboy_k8s
 import resourceclaim
 import resourcehandle
+import resourceprovider
 
+from keyed_dispatcher import KeyedDispatcher
 from poolboy import Poolboy
 
 logger = logging.getLogger('resource_watcher')
@@ -17,7 +22,6 @@ resource_claim_name_annotation = f"{Poolboy.operator_domain}/resource-claim-name
 resource_claim_namespace_annotation = f"{Poolboy.operator_domain}/resource-claim-namespace"
 resource_handle_name_annotation = f"{Poolboy.operator_domain}/resource-handle-name"
 resource_handle_namespace_annotation = f"{Poolboy.operator_domain}/resource-handle-namespace"
-resource_index_annotation = f"{Poolboy.operator_domain}/resource-index"
 
 class ResourceWatchFailedError(Exception):
     pass
@@ -27,21 +31,80 @@ class ResourceWatchRestartError(Exception):
 
 ResourceWatcherT = TypeVar('ResourceWatcherT', bound='ResourceWatcher')
 
+def _copy_pointer_value(source, dest, parts):
+    """Copy value at JSON pointer parts from source to dest, creating parent dicts."""
+    key = parts[0]
+    if key not in source:
+        return
+    if len(parts) == 1 or not isinstance(source[key], Mapping):
+        dest[key] = source[key]
+    else:
+        value = dest.get(key)
+        if value is source[key]:
+            return
+        if not isinstance(value, dict):
+            value = dest[key] = {}
+        _copy_pointer_value(source[key], value, parts[1:])
+
 class ResourceWatcher:
     instances = {}
     class_lock = asyncio.Lock()
+    # Events waiting for the coalescing window keyed by ResourceHandle name
+    coalescing_events = {}
+    coalescing_tasks = set()
+    # Handles events for different ResourceHandles concurrently
+    event_dispatcher = KeyedDispatcher(
+        queue_size = Poolboy.resource_event_queue_size,
+        workers = Poolboy.resource_event_workers,
+    )
+    events_processed = 0
+    idle_watcher_task = None
+    events_received = 0
+    events_suppressed = 0
+    orphaned_resource_events = 0
 
     class CacheEntry:
-        def __init__(self, resource):
+        def __init__(self, resource, status_paths=None, from_get=False):
             resource['metadata'].pop('managedFields', None)
             if 'status' in resource:
                 resource['status'].pop('diffBase', None)
             self.resource = resource
-            self.cache_datetime = datetime.now(timezone.utc)
+            self.cache_time = time.monotonic()
+            # Entries filled by a GET are not known to the watch if it missed
+            # the resource, so they expire even while the watch is live.
+            self.from_get = from_get
+            if status_paths is None:
+                self.fingerprint = self.__fingerprint()
+            else:
+                self.project(status_paths)
+
+        def __fingerprint(self) -> bytes:
+            """Digest of cached content ignoring resourceVersion."""
+            metadata = self.resource['metadata']
+            data = json.dumps(
+                {
+                    **self.resource,
+                    "metadata": {k: v for k, v in metadata.items() if k != 'resourceVersion'},
+                },
+                default = str,
+                separators = (',', ':'),
+                sort_keys = True,
+            )
+            return hashlib.blake2b(data.encode('utf-8'), digest_size=16).digest()
+
+        def project(self, status_paths: FrozenSet[str]) -> None:
+            """Reduce resource status to only the fields at status_paths."""
+            status = self.resource.get('status')
+            if isinstance(status, Mapping):
+                projected_status = {}
+                for path in status_paths:
+                    _copy_pointer_value(status, projected_status, jsonpointer.JsonPointer(path).parts)
+                self.resource['status'] = projected_status
+            self.fingerprint = self.__fingerprint()
 
         @property
         def is_expired(self):
-            return (datetime.now(timezone.utc) - self.cache_datetime).total_seconds() > Poolboy.resource_refresh_interval
+            return time.monotonic() - self.cache_time > Poolboy.resource_refresh_interval
 
     @classmethod
     def get_watcher(cls,
@@ -49,8 +112,12 @@ class ResourceWatcher:
         kind: str,
         namespace: Optional[str] = None,
     ) -> Optional[ResourceWatcherT]:
-        key = (api_version, kind, namespace) if namespace else (api_version, kind)
-        return ResourceWatcher.instances.get(key)
+        # A cluster watcher also covers resources in any namespace
+        if namespace:
+            resource_watcher = ResourceWatcher.instances.get((api_version, kind, namespace))
+            if resource_watcher:
+                return resource_watcher
+        return ResourceWatcher.instances.get((api_version, kind))
 
     @classmethod
     async def get_resource(cls,
@@ -61,13 +128,19 @@ class ResourceWatcher:
     ) -> Optional[Mapping]:
         watcher = cls.get_watcher(api_version=api_version, kind=kind, namespace=namespace)
         if watcher:
-            cache_entry = watcher.cache.get(name)
-            if cache_entry and not cache_entry.is_expired:
+            cache_entry = watcher.cache.get((namespace, name))
+            # Entries from list and watch are authoritative while the watch is
+            # live, otherwise entries expire after the resource refresh interval.
+            if cache_entry and (
+                (watcher.is_live and not cache_entry.from_get) or not cache_entry.is_expired
+            ):
                 return cache_entry.resource
         try:
             resource = await poolboy_k8s.get_object(api_version=api_version, kind=kind, name=name, namespace=namespace)
             if resource and watcher:
-                watcher.cache[name] = ResourceWatcher.CacheEntry(resource)
+                cache_entry = ResourceWatcher.CacheEntry(resource, watcher.status_paths, from_get=True)
+                watcher.cache[(namespace, name)] = cache_entry
+                return cache_entry.resource
             return resource
         except kubernetes_asyncio.client.exceptions.ApiException as exception:
             if exception.status == 404:
@@ -80,12 +153,21 @@ class ResourceWatcher:
         api_version: str,
         kind: str,
         namespace: str,
-    ) -> None:
+    ) -> ResourceWatcherT:
         key = (api_version, kind, namespace) if namespace else (api_version, kind)
         async with cls.class_lock:
-            resource_watcher = cls.instances.get(key)
+            if not cls.idle_watcher_task:
+                cls.idle_watcher_task = asyncio.create_task(cls.__stop_idle_watchers())
+            resource_watcher = cls.get_watcher(api_version=api_version, kind=kind, namespace=namespace)
             if resource_watcher:
-                return
+                return resource_watcher
+            if namespace and Poolboy.resource_watch_cluster_threshold > 0:
+                namespaced_keys = [
+                    k for k in cls.instances.keys()
+                    if len(k) == 3 and k[0] == api_version and k[1] == kind
+                ]
+                if len(namespaced_keys) >= Poolboy.resource_watch_cluster_threshold:
+                    return cls.__consolidate_watchers(api_version=api_version, kind=kind, keys=namespaced_keys)
             resource_watcher = cls(
                 api_version = api_version,
                 kind = kind,
@@ -93,15 +175,72 @@ class ResourceWatcher:
             )
             cls.instances[key] = resource_watcher
             resource_watcher.start()
+            return resource_watcher
+
+    @classmethod
+    def __consolidate_watchers(cls, api_version: str, kind: str, keys: List[tuple]) -> ResourceWatcherT:
+        """
+        Replace namespaced watchers for a kind with a single cluster watcher.
+        Must be called with the class lock held.
+        """
+        resource_watcher = cls(api_version=api_version, kind=kind)
+        logger.info(f"Consolidating {len(keys)} namespaced watches into {resource_watcher}")
+        for key in keys:
+            namespaced_watcher = cls.instances.pop(key)
+            namespaced_watcher.cancel()
+        cls.instances[(api_version, kind)] = resource_watcher
+        resource_watcher.start()
+        return resource_watcher
+
+    @classmethod
+    async def __stop_idle_watchers(cls):
+        """
+        Stop watchers once no ResourceHandle has referenced a resource they
+        watch for the idle timeout.
+        """
+        while True:
+            await asyncio.sleep(min(60, Poolboy.resource_watch_idle_timeout))
+            try:
+                async with cls.class_lock:
+                    now = time.monotonic()
+                    for key, resource_watcher in list(cls.instances.items()):
+                        if resourcehandle.ResourceHandle.count_resource_references(
+                            api_version = resource_watcher.api_version,
+                            kind = resource_watcher.kind,
+                            namespace = resource_watcher.namespace,
+                        ) > 0:
+                            resource_watcher.idle_since = None
+                        elif resource_watcher.idle_since is None:
+                            resource_watcher.idle_since = now
+                        elif now - resource_watcher.idle_since >= Poolboy.resource_watch_idle_timeout:
+                            logger.info(f"Stopping idle {resource_watcher}")
+                            resource_watcher.cancel()
+                            del cls.instances[key]
+            except Exception:
+                logger.exception("Failed to stop idle resource watchers")
+
+    @classmethod
+    def refresh_all_status_paths(cls) -> None:
+        """Recompute status paths for all watchers after ResourceProvider changes."""
+        for resource_watcher in list(cls.instances.values()):
+            resource_watcher.refresh_status_paths()
 
     @classmethod
     async def stop_all(cls):
         async with cls.class_lock:
             tasks = []
+            if cls.idle_watcher_task:
+                cls.idle_watcher_task.cancel()
+                tasks.append(cls.idle_watcher_task)
+                cls.idle_watcher_task = None
             for resource_watcher in cls.instances.values():
                 resource_watcher.cancel()
                 tasks.append(resource_watcher.task)
-            await asyncio.gather(*tasks)
+            for task in cls.coalescing_tasks:
+                task.cancel()
+                tasks.append(task)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await cls.event_dispatcher.stop()
 
     def __init__(self,
         api_version: str,
@@ -110,12 +249,31 @@ class ResourceWatcher:
     ):
         self.api_version = api_version
         self.cache = {}
+        self.connected = False
+        self.idle_since = None
         self.kind = kind
+        # Set after the first successful list, later lists are relists
+        self.listed = False
         self.namespace = namespace
+        self.resource_version = None
+        self.status_paths = resourceprovider.ResourceProvider.get_resource_status_paths(
+            api_version = api_version,
+            kind = kind,
+        )
+        # Set after each list attempt so waiters do not wait out their
+        # timeout when listing fails.
+        self.sync_attempted = asyncio.Event()
+        self.sync_error = None
+        self.synced = asyncio.Event()
 
     def __str__(self):
         return f"ResourceWatch for {self.watch_target_description}"
 
+    @property
+    def is_live(self) -> bool:
+        """Whether the watch stream is connected and the cache is synced."""
+        return self.connected and self.synced.is_set()
+
     @property
     def watch_target_description(self):
         if self.namespace:
@@ -126,13 +284,57 @@ class ResourceWatcher:
     def cancel(self):
         self.task.cancel()
 
+    def refresh_status_paths(self) -> None:
+        """
+        Recompute status paths to cache from all ResourceProviders which may
+        create the watched kind. The full status is cached unless every such
+        provider declares status paths.
+        """
+        previous_status_paths = self.status_paths
+        self.status_paths = resourceprovider.ResourceProvider.get_resource_status_paths(
+            api_version = self.api_version,
+            kind = self.kind,
+        )
+        if self.status_paths == previous_status_paths:
+            return
+
+        if previous_status_paths is None or (
+            self.status_paths is not None and self.status_paths <= previous_status_paths
+        ):
+            for cache_entry in self.cache.values():
+                cache_entry.project(self.status_paths)
+        else:
+            # Cached resources lack newly required fields, refetch on demand
+            self.cache.clear()
+
     def start(self):
         logger.info(f"Starting {self}")
         self.task = asyncio.create_task(self.watch())
 
+    async def wait_synced(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for initial list to fill the cache. Return whether synced, which
+        is immediately false if the last attempt to list failed.
+        """
+        if self.synced.is_set():
+            return True
+        if self.sync_error:
+            return False
+        try:
+            await asyncio.wait_for(self.sync_attempted.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.synced.is_set()
+
+    def __remove(self) -> None:
+        """Remove stopped watcher so that a later request starts a new one."""
+        for key, resource_watcher in list(ResourceWatcher.instances.items()):
+            if resource_watcher is self:
+                del ResourceWatcher.instances[key]
+
     async def watch(self):
         try:
-            if '/' in self.api_version:
+            if self.api_version not in poolboy_k8s.typed_api_classes:
                 group, version = self.api_version.split('/')
                 plural = await poolboy_k8s.kind_to_plural(group=group, version=version, kind=self.kind)
                 kwargs = dict(group=group, plural=plural, version=version)
@@ -141,16 +343,29 @@ class ResourceWatcher:
                     kwargs['namespace'] = self.namespace
                 else:
                     method = Poolboy.custom_objects_api.list_cluster_custom_object
-            elif self.namespace:
-                method = getattr(
-                    Poolboy.core_v1_api, "list_namespaced_" + inflection.underscore(self.kind)
-                )
-                kwargs = dict(namespace=namespace)
             else:
-                method = getattr(
-                    Poolboy.core_v1_api, "list_" + inflection.underscore(self.kind)
+                # List without namespace lists namespaced kinds in all namespaces
+                method = poolboy_k8s.get_typed_api_method(
+                    api_version = self.api_version,
+                    kind = self.kind,
+                    namespaced = bool(self.namespace),
+                    verb = 'list',
                 )
-                kwargs = {}
+                kwargs = dict(namespace=self.namespace) if self.namespace else {}
+        except asyncio.CancelledError:
+            return
+        except Exception as exception:
+            # Kind cannot be watched, such as when a CustomResourceDefinition
+            # is not installed.
+            logger.warning(f"Unable to start {self}: {exception}")
+            self.sync_error = exception
+            self.sync_attempted.set()
+            self.__remove()
+            return
+
+        try:
+            if Poolboy.watch_managed_resources_only:
+                kwargs['label_selector'] = f"{Poolboy.managed_label}=true"
 
             while True:
                 watch_start_dt = datetime.now(timezone.utc)
@@ -179,52 +394,129 @@ class ResourceWatcher:
         except asyncio.CancelledError:
             return
 
+    async def __list(self, method, **kwargs):
+        """
+        List all resources in pages to fill the cache and set the resource
+        version to watch from. If this is a relist then events are dispatched
+        for resources which changed since the previous cache was filled.
+        """
+        cache = {}
+        _continue = None
+        try:
+            while True:
+                resource_list = await poolboy_k8s.call_raw(
+                    method,
+                    _continue = _continue,
+                    limit = Poolboy.resource_watch_list_limit,
+                    **kwargs
+                )
+                for resource in resource_list.get('items', []):
+                    # List items do not include apiVersion and kind
+                    resource.setdefault('apiVersion', self.api_version)
+                    resource.setdefault('kind', self.kind)
+                    cache[(
+                        resource['metadata'].get('namespace'), resource['metadata']['name']
+                    )] = self.CacheEntry(resource, self.status_paths)
+                _continue = resource_list['metadata'].get('continue')
+                if not _continue:
+                    break
+        except Exception as exception:
+            self.sync_error = exception
+            self.sync_attempted.set()
+            if (
+                isinstance(exception, kubernetes_asyncio.client.exceptions.ApiException) and
+                exception.status == 410
+            ):
+                raise ResourceWatchRestartError("Received 410 expired response during list.")
+            else:
+                raise
+
+        # Entries filled by GET before the first list are not a previous list
+        relist = self.listed
+        self.listed = True
+        previous_cache = self.cache
+        self.cache = cache
+        self.resource_version = resource_list['metadata']['resourceVersion']
+        self.sync_error = None
+        self.synced.set()
+        self.sync_attempted.set()
+
+        if not relist:
+            return
+
+        for key, cache_entry in cache.items():
+            previous_cache_entry = previous_cache.get(key)
+            if not previous_cache_entry:
+                await self.__watch_event(event_type='ADDED', event_obj=cache_entry.resource)
+            elif previous_cache_entry.fingerprint != cache_entry.fingerprint:
+                await self.__watch_event(event_type='MODIFIED', event_obj=cache_entry.resource)
+            else:
+                ResourceWatcher.events_suppressed += 1
+        for key, previous_cache_entry in previous_cache.items():
+            if key not in cache:
+                await self.__watch_event(event_type='DELETED', event_obj=previous_cache_entry.resource)
+
     async def __watch(self, method, **kwargs):
         watch = None
-        self.cache.clear()
+        if not self.resource_version:
+            await self.__list(method, **kwargs)
         try:
-            watch = kubernetes_asyncio.watch.Watch()
-            async for event in watch.stream(method, **kwargs):
+            watch = poolboy_k8s.RawWatch()
+            self.connected = True
+            async for event in watch.stream(
+                method,
+                allow_watch_bookmarks = True,
+                resource_version = self.resource_version,
+                **kwargs
+            ):
                 if not isinstance(event, Mapping):
                     raise ResourceWatchFailedError(f"UNKNOWN EVENT: {event}")
 
                 event_obj = event['object']
                 event_type = event['type']
-                if not isinstance(event_obj, Mapping):
-                    event_obj = Poolboy.api_client.sanitize_for_serialization(event_obj)
+                if event_type == 'BOOKMARK':
+                    self.resource_version = event_obj['metadata']['resourceVersion']
+                    continue
                 if event_type == 'ERROR':
                     if event_obj['kind'] == 'Status':
                         if event_obj['reason'] in ('Expired', 'Gone'):
+                            self.resource_version = None
+                            self.synced.clear()
                             raise ResourceWatchRestartError(event_obj['reason'].lower())
                         else:
                             raise ResourceWatchFailedError(f"{event_obj['reason']} {event_obj['message']}")
                     else:
                         raise ResourceWatchFailedError(f"UNKNOWN EVENT: {event}")
 
-                name = event_obj['metadata']['name']
+                key = (event_obj['metadata'].get('namespace'), event_obj['metadata']['name'])
+                self.resource_version = event_obj['metadata'].get('resourceVersion', self.resource_version)
                 if event_type == 'DELETED':
-                    self.cache.pop(name, None)
+                    self.cache.pop(key, None)
                 else:
-                    self.cache[name] = self.CacheEntry(event_obj)
+                    cache_entry = self.CacheEntry(event_obj, self.status_paths)
+                    previous_cache_entry = self.cache.get(key)
+                    self.cache[key] = cache_entry
+                    event_obj = cache_entry.resource
+                    # Skip events which only change resourceVersion or
+                    # fields which are not cached.
+                    if previous_cache_entry and previous_cache_entry.fingerprint == cache_entry.fingerprint:
+                        ResourceWatcher.events_suppressed += 1
+                        continue
 
                 await self.__watch_event(event_type=event_type, event_obj=event_obj)
         except kubernetes_asyncio.client.exceptions.ApiException as exception:
             if exception.status == 410:
+                self.resource_version = None
+                self.synced.clear()
                 raise ResourceWatchRestartError("Received 410 expired response.")
             else:
                 raise
         finally:
+            self.connected = False
             if watch:
                 await watch.close()
 
     async def __watch_event(self, event_type, event_obj):
-        event_obj_annotations = event_obj['metadata'].get('annotations')
-        if not event_obj_annotations:
-            return
-
-        resource_handle_name = event_obj_annotations.get(resource_handle_name_annotation)
-        resource_handle_namespace = event_obj_annotations.get(resource_handle_namespace_annotation)
-        resource_index = int(event_obj_annotations.get(resource_index_annotation, 0))
         resource_name = event_obj['metadata']['name']
         resource_namespace = event_obj['metadata'].get('namespace')
         resource_description = (
@@ -233,9 +525,62 @@ class ResourceWatcher:
             f"{event_obj['apiVersion']} {event_obj['kind']} {resource_name}"
         )
 
-        if not resource_handle_name or not resource_handle_namespace:
+        # Route by ResourceHandle references first so that events reach the
+        # handle even if annotations were removed from the resource.
+        index_entry = resourcehandle.ResourceHandle.resource_reference_index.get(
+            (event_obj['apiVersion'], event_obj['kind'], resource_namespace, resource_name)
+        )
+        if index_entry:
+            resource_handle_name = index_entry[0]
+        else:
+            event_obj_annotations = event_obj['metadata'].get('annotations')
+            if not event_obj_annotations:
+                return
+            resource_handle_name = event_obj_annotations.get(resource_handle_name_annotation)
+            resource_handle_namespace = event_obj_annotations.get(resource_handle_namespace_annotation)
+            if not resource_handle_name or not resource_handle_namespace:
+                return
+            logger.debug(f"{resource_description} is not referenced by a known ResourceHandle")
+
+        ResourceWatcher.events_received += 1
+        coalescing = resource_handle_name in ResourceWatcher.coalescing_events
+        # Events for more ResourceHandles than the dispatcher can queue are
+        # dispatched without coalescing so that the watch stream waits for
+        # the dispatcher rather than accumulating coalescing tasks.
+        if Poolboy.resource_event_coalesce_window <= 0 or (
+            not coalescing and
+            len(ResourceWatcher.coalescing_events) >= Poolboy.resource_event_queue_size * Poolboy.resource_event_workers
+        ):
+            await ResourceWatcher.event_dispatcher.dispatch(
+                resource_handle_name,
+                self.__handle_event,
+                event_obj = event_obj,
+                resource_description = resource_description,
+                resource_handle_name = resource_handle_name,
+            )
             return
 
+        # Collapse bursts of events for a ResourceHandle into one update. Only
+        # the latest event is kept as handling uses current cached state.
+        ResourceWatcher.coalescing_events[resource_handle_name] = (self, event_obj, resource_description)
+        if not coalescing:
+            task = asyncio.create_task(self.__coalesce_events(resource_handle_name))
+            ResourceWatcher.coalescing_tasks.add(task)
+            task.add_done_callback(ResourceWatcher.coalescing_tasks.discard)
+
+    async def __coalesce_events(self, resource_handle_name):
+        await asyncio.sleep(Poolboy.resource_event_coalesce_window)
+        resource_watcher, event_obj, resource_description = ResourceWatcher.coalescing_events.pop(resource_handle_name)
+        await ResourceWatcher.event_dispatcher.dispatch(
+            resource_handle_name,
+            resource_watcher.__handle_event,
+            event_obj = event_obj,
+            resource_description = resource_description,
+            resource_handle_name = resource_handle_name,
+        )
+
+    async def __handle_event(self, event_obj, resource_description, resource_handle_name):
+        ResourceWatcher.events_processed += 1
         try:
             resource_handle = await resourcehandle.ResourceHandle.get(
                 ignore_deleting=False,
@@ -244,6 +589,7 @@ class ResourceWatcher:
         except kubernetes_asyncio.client.exceptions.ApiException as exception:
             if exception.status == 404:
                 if 'deletionTimestamp' not in event_obj['metadata']:
+                    ResourceWatcher.orphaned_resource_events += 1
                     logger.warning(
                         f"Received event on {resource_description} for deleted ResourceHandle {resource_handle_name}"
                     )
@@ -4,7 +4,7 @@ import unittest
 import sys
 sys.path.append('../operator')
 
-from jsonpatch_from_diff import jsonpatch_from_diff
+from jsonpatch_from_diff import filter_definition, jsonpatch_from_diff
 
 class TestJsonPatch(unittest.TestCase):
     def test_00(self):
@@ -137,5 +137,54 @@ class TestJsonPatch(unittest.TestCase):
             {'op': 'add', 'path': '/0/d/3', 'value':4},
         ])
 
+    def test_16(self):
+        definition = {
+            'metadata': {'name': 'test', 'labels': {'app': 'a'}},
+            'spec': {'desiredState': 'started', 'password': 'new', 'items': [1, 2]},
+        }
+        current = {
+            'metadata': {'name': 'test'},
+            'spec': {'desiredState': 'stopped', 'password': 'old'},
+        }
+        update_filters = [
+            {'pathMatch': '/metadata/labels'},
+            {'pathMatch': '/spec/desiredState'},
+            {'pathMatch': '/spec/password', 'allowedOps': ['add']},
+        ]
+        # Existing values which may not be replaced are kept as is
+        self.assertEqual(filter_definition(definition, current, update_filters), {
+            'metadata': {'name': 'test', 'labels': {'app': 'a'}},
+            'spec': {'desiredState': 'started', 'password': 'old'},
+        })
+        # Password may only be added if not already set
+        del current['spec']['password']
+        self.assertEqual(filter_definition(definition, current, update_filters), {
+            'metadata': {'name': 'test', 'labels': {'app': 'a'}},
+            'spec': {'desiredState': 'started', 'password': 'new'},
+        })
+        self.assertEqual(filter_definition(definition, current, [{'pathMatch': '/status'}]), {
+            'metadata': {'name': 'test'},
+            'spec': {'desiredState': 'stopped'},
+        })
+
+    def test_17(self):
+        # Apply of a generated value which may only be added keeps sending the
+        # added value on later applies so that it is not removed.
+        definition = {
+            'metadata': {'name': 'test'},
+            'spec': {'password': 'generated-1'},
+        }
+        update_filters = [
+            {'pathMatch': '/spec/password', 'allowedOps': ['add']},
+        ]
+        current = {'metadata': {'name': 'test'}, 'spec': {}}
+        first_apply = filter_definition(definition, current, update_filters)
+        self.assertEqual(first_apply['spec'], {'password': 'generated-1'})
+        current['spec'].update(first_apply['spec'])
+
+        definition['spec']['password'] = 'generated-2'
+        second_apply = filter_definition(definition, current, update_filters)
+        self.assertEqual(second_apply['spec'], {'password': 'generated-1'})
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+import sys
+sys.path.append('../operator')
+
+from keyed_dispatcher import KeyedDispatcher
+
+class TestKeyedDispatcher(unittest.TestCase):
+    def test_00(self):
+        calls = []
+
+        async def handle(key, value):
+            await asyncio.sleep(0.01 if value == 0 else 0)
+            calls.append((key, value))
+
+        async def run():
+            dispatcher = KeyedDispatcher(workers=4, queue_size=2)
+            for value in range(5):
+                for key in ('a', 'b', 'c'):
+                    await dispatcher.dispatch(key, handle, key, value)
+            await dispatcher.join()
+            await dispatcher.stop()
+            return dispatcher
+
+        dispatcher = asyncio.run(run())
+        self.assertEqual(len(calls), 15)
+        for key in ('a', 'b', 'c'):
+            self.assertEqual([value for k, value in calls if k == key], list(range(5)))
+        self.assertFalse(dispatcher.is_running)
+
+    def test_01(self):
+        calls = []
+
+        async def handle(value):
+            if value == 1:
+                raise Exception("failed")
+            calls.append(value)
+
+        async def run():
+            dispatcher = KeyedDispatcher(workers=1)
+            for value in range(3):
+                await dispatcher.dispatch('a', handle, value)
+            await dispatcher.join()
+            self.assertEqual(dispatcher.queue_depth, 0)
+            await dispatcher.stop()
+
+        asyncio.run(run())
+        self.assertEqual(calls, [0, 2])
+
+    def test_02(self):
+        calls = []
+
+        async def handle(value):
+            if value == 1:
+                raise asyncio.CancelledError()
+            calls.append(value)
+
+        async def run():
+            dispatcher = KeyedDispatcher(workers=1)
+            for value in range(3):
+                await dispatcher.dispatch('a', handle, value)
+            await asyncio.wait_for(dispatcher.join(), timeout=1)
+            self.assertTrue(all(not task.done() for task in dispatcher.tasks))
+            await dispatcher.stop()
+            return dispatcher
+
+        dispatcher = asyncio.run(run())
+        self.assertEqual(calls, [0, 2])
+        self.assertFalse(dispatcher.is_running)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
+import asyncio
+import jmespath
 import unittest
 import sys
 sys.path.append('../operator')
 
-from poolboy_templating import recursive_process_template_strings, seconds_to_interval
+from collections import ChainMap
+from poolboy_templating import CompiledCondition, JMESPathCache, TemplateCache, TemplateRenderExecutor, TemplateTree, jinja2envs, evaluate_expression, jmespath_cache, recursive_process_template_strings, seconds_to_interval, template_cache
 
 class TestJsonPatch(unittest.TestCase):
     def test_00(self):
@@ -435,5 +438,278 @@ class TestJsonPatch(unittest.TestCase):
             recursive_process_template_strings(template, 'jinja2', template_vars), {"a": "A"}
         )
 
+    def test_32(self):
+        template_cache.clear()
+        template = {
+            "a": "{{ a }}",
+            "b": ["{{ a }}", "{{ a }}"],
+        }
+        template_vars = {
+            "a": "A",
+        }
+        self.assertEqual(
+            recursive_process_template_strings(template, 'jinja2', template_vars),
+            {"a": "A", "b": ["A", "A"]}
+        )
+        self.assertEqual(template_cache.misses, 1)
+        self.assertEqual(template_cache.hits, 2)
+
+    def test_33(self):
+        cache = TemplateCache(maxsize=2)
+        cache.get("{{ a }}")
+        cache.get("{{ b }}")
+        cache.get("{{ a }}")
+        cache.get("{{ c }}")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(cache.get("{{ a }}").render({"a": "A"}), "A")
+        self.assertEqual(cache.hits, 2)
+
+    def test_34(self):
+        template = {
+            "static": {
+                "a": "A",
+                "b": [1, 2, {"c": "C"}],
+            },
+            "dynamic": ["x", "{{ x }}"],
+            "newline": "line\n",
+        }
+        tree = TemplateTree(template)
+        self.assertFalse(tree.is_static)
+        template_out = tree.render({"x": "X"})
+        self.assertEqual(
+            template_out,
+            {
+                "static": {
+                    "a": "A",
+                    "b": [1, 2, {"c": "C"}],
+                },
+                "dynamic": ["x", "X"],
+                "newline": "line",
+            }
+        )
+        template_out['static']['b'].append(3)
+        self.assertEqual(template['static']['b'], [1, 2, {"c": "C"}])
+
+    def test_35(self):
+        template = {
+            "a": "A",
+            "b": [1, 2, {"c": "C"}],
+        }
+        tree = TemplateTree(template)
+        self.assertTrue(tree.is_static)
+        self.assertEqual(tree.render({}), template)
+        self.assertIsNot(tree.render({}), template)
+
+    def test_36(self):
+        template = {
+            "a": "{{ a | object }}",
+            "b": "{{ b | int }}",
+            "c": "{{ c | bool }}",
+        }
+        template_vars = {
+            "a": {"list": [1, 2], "tuple": (3, 4)},
+            "b": "21",
+            "c": "yes",
+        }
+        template_out = recursive_process_template_strings(template, 'jinja2', template_vars)
+        self.assertEqual(
+            template_out,
+            {
+                "a": {"list": [1, 2], "tuple": [3, 4]},
+                "b": 21,
+                "c": True,
+            }
+        )
+        self.assertIsNot(template_out['a']['list'], template_vars['a']['list'])
+
+    def test_37(self):
+        condition = CompiledCondition("status.ready and now(True, '%FT%TZ') > start")
+        self.assertTrue(condition.evaluate({"status": {"ready": True}, "start": "2000-01-01T00:00:00Z"}))
+        self.assertFalse(condition.evaluate({"status": {"ready": False}, "start": "2000-01-01T00:00:00Z"}))
+        self.assertFalse(condition.evaluate({"status": {}, "start": "2000-01-01T00:00:00Z"}))
+        self.assertTrue(CompiledCondition("value").evaluate({"value": "yes"}))
+
+    def test_38(self):
+        condition = CompiledCondition("status.ready ==")
+        with self.assertRaises(Exception):
+            condition.evaluate({})
+
+    def test_39(self):
+        condition = CompiledCondition("status.ready")
+        results = condition.evaluate_many([
+            {"status": {"ready": True}},
+            {"status": {"ready": "no"}},
+            {"status": {"ready": "maybe"}},
+            {},
+        ])
+        self.assertEqual(results[0:2], [True, False])
+        self.assertIsInstance(results[2], ValueError)
+        self.assertEqual(results[3], False)
+
+    def test_40(self):
+        template = {
+            "a": "{{ a }}",
+            "b": "{{ b | int }}",
+            "c": "{% set b = 0 %}{{ b }}",
+            "d": "{{ timestamp.add('1h') > timestamp }}",
+        }
+        template_vars = ChainMap({"a": "A"}, {"a": "X", "b": "2"})
+        self.assertEqual(
+            recursive_process_template_strings(template, variables=template_vars),
+            {"a": "A", "b": 2, "c": "0", "d": "True"}
+        )
+        self.assertEqual(template_vars.maps, [{"a": "A"}, {"a": "X", "b": "2"}])
+
+    def test_41(self):
+        template_tree = TemplateTree({"a": "{{ a.b }}", "c": ["{{ c | int }}"]}, memoize=True)
+        self.assertEqual(template_tree.referenced_variables, ('a', 'c'))
+        template_out = template_tree.render({"a": {"b": "B"}, "c": "1", "d": object()})
+        self.assertEqual(template_out, {"a": "B", "c": [1]})
+        template_out['c'].append(2)
+        self.assertEqual(template_tree.render({"a": {"b": "B"}, "c": "1"}), {"a": "B", "c": [1]})
+        self.assertEqual(template_tree.render({"a": {"b": "X"}, "c": "1"}), {"a": "X", "c": [1]})
+        self.assertEqual(template_tree.render_cache.hits, 1)
+        self.assertEqual(template_tree.render_cache.misses, 2)
+
+    def test_42(self):
+        for template in (
+            "{{ now() }}",
+            "{{ timestamp.add('1h') }}",
+            "{{ '[a-z]{4}' | strgen }}",
+            "{{ [1, 2] | random }}",
+        ):
+            self.assertIsNone(TemplateTree({"a": template}, memoize=True).render_cache)
+
+    def test_43(self):
+        cache = JMESPathCache(maxsize=2)
+        data = {"items": [{"name": "a", "ready": True}, {"name": "b", "ready": False}]}
+        self.assertEqual(cache.search("items[?ready].name", data), ["a"])
+        self.assertEqual(cache.search("items[?ready].name", data), ["a"])
+        self.assertEqual(cache.search("items[].name", data), ["a", "b"])
+        self.assertEqual(cache.search("length(items)", data), 2)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions, len(cache)), (1, 3, 1, 2))
+
+    def test_44(self):
+        # Check json_query with cached compiled expressions against
+        # jmespath.search on a status summary style template.
+        template = {
+            "ready": '{{ resources | json_query("[].state.status.conditions[?type==\'Ready\'].status[]") | select("equalto", "True") | list | length == resources | length }}',
+            "nodes": '{{ resources | json_query("[].state.status.nodes[?phase==\'Running\'].name[]") | object }}',
+            "addresses": '{{ resources | json_query("[].state.status.addresses[].{host: host, port: port}") | object }}',
+        }
+        template_vars = {
+            "resources": [
+                {
+                    "state": {
+                        "status": {
+                            "addresses": [{"host": f"host-{i}-{j}", "port": 8000 + j} for j in range(20)],
+                            "conditions": [{"type": "Ready", "status": "True"}, {"type": "Synced", "status": "True"}],
+                            "nodes": [{"name": f"node-{i}-{j}", "phase": "Running" if j % 3 else "Pending"} for j in range(50)],
+                        }
+                    }
+                } for i in range(10)
+            ]
+        }
+        iterations = 10
+        filters = jinja2envs['jinja2'].filters
+        json_query = filters['json_query']
+        try:
+            filters['json_query'] = lambda x, query: jmespath.search(query, x)
+            expected = TemplateTree(template).render(template_vars)
+        finally:
+            filters['json_query'] = json_query
+        hits = jmespath_cache.hits
+        for i in range(iterations):
+            template_out = TemplateTree(template).render(template_vars)
+        self.assertEqual(template_out, expected)
+        self.assertTrue(expected['ready'])
+        self.assertEqual(len(expected['addresses']), 200)
+        self.assertGreaterEqual(jmespath_cache.hits - hits, 3 * (iterations - 1))
+
+    def test_45(self):
+        template = {
+            "a": "{{ omit }}",
+            "b": ["{{ omit }}", "{{ b | default(omit) }}", "{{ c | default(omit) }}"],
+            "c": {"d": "{{ omit }}"},
+            "e": "{{ {'f': omit, 'g': [omit, 1]} | object }}",
+        }
+        self.assertEqual(
+            recursive_process_template_strings(template, variables={"b": "B"}),
+            {"b": ["B"], "c": {}, "e": {"g": [1]}}
+        )
+        self.assertEqual(recursive_process_template_strings("{{ omit }}"), None)
+
+    def test_46(self):
+        template_tree = TemplateTree({"a": ["{{ a }}", "{{ a | int + 1 }}"], "b": "{{ b | default(omit) }}"})
+        self.assertEqual(template_tree.dynamic_count, 3)
+
+        async def render_all(executor):
+            return await asyncio.gather(*[
+                executor.render(template_tree, {"a": str(i)}) for i in range(10)
+            ])
+
+        executor = TemplateRenderExecutor(max_workers=2, threshold=3)
+        try:
+            results = asyncio.run(render_all(executor))
+        finally:
+            executor.shutdown()
+        self.assertEqual(results, [{"a": [str(i), str(i + 1)]} for i in range(10)])
+        self.assertEqual(executor.offloaded, 10)
+        self.assertEqual(executor.queue_depth, 0)
+
+        executor = TemplateRenderExecutor(max_workers=2, threshold=4)
+        asyncio.run(render_all(executor))
+        self.assertEqual(executor.offloaded, 0)
+        self.assertIsNone(executor.executor)
+
+    def test_47(self):
+        # evaluate_expression and template rendering use Jinja2 internals to
+        # avoid copying the context, results must match the public API.
+        jinja2env = jinja2envs['jinja2']
+        variables = {"a": 1, "b": {"c": [1, 2, 3]}, "s": "x"}
+        context = ChainMap({"a": 2}, variables)
+        for expression in ["a + 1", "b.c | length", "s ~ a", "missing is undefined", "b.c[1:]"]:
+            compiled = jinja2env.compile_expression(expression)
+            self.assertEqual(
+                evaluate_expression(compiled, context),
+                compiled(**dict(context)),
+            )
+        for template in ["{{ a }}-{{ s }}", "{% for i in b.c %}{{ i }}{% endfor %}", "{{ now() is string }}"]:
+            self.assertEqual(
+                template_cache.get(template, 'jinja2').j2template.render(dict(context)),
+                recursive_process_template_strings(template, 'jinja2', context),
+            )
+        with self.assertRaises(ZeroDivisionError):
+            recursive_process_template_strings("{{ a / 0 }} {{ s }}", 'jinja2', context)
+
+    def test_48(self):
+        # Template helpers take precedence over variables of the same name
+        template_out = recursive_process_template_strings(
+            {"timestamp": "{{ timestamp }}", "now": "{{ now is callable }}"},
+            'jinja2',
+            {"timestamp": "mine", "now": "mine"},
+        )
+        self.assertNotEqual(template_out['timestamp'], "mine")
+        self.assertEqual(template_out['now'], 'True')
+        self.assertTrue(CompiledCondition("now is callable").evaluate({"now": "mine"}))
+
+    def test_49(self):
+        # One rendering is kept per cache key and reused while unchanged
+        template_tree = TemplateTree({"a": "{{ a }}"}, memoize=True)
+        for i in range(3):
+            self.assertEqual(template_tree.render({"a": "A"}, cache_key=("handle", 0)), {"a": "A"})
+        self.assertEqual(template_tree.render({"a": "B"}, cache_key=("handle", 0)), {"a": "B"})
+        self.assertEqual(template_tree.render({"a": "A"}, cache_key=("handle", 1)), {"a": "A"})
+        self.assertEqual(len(template_tree.render_cache), 2)
+        self.assertEqual(template_tree.render_cache.hits, 2)
+        self.assertEqual(template_tree.render_cache.misses, 3)
+        self.assertEqual(
+            asyncio.run(template_tree.render_async({"a": "B"}, cache_key=("handle", 0))), {"a": "B"}
+        )
+        self.assertEqual(template_tree.render_cache.hits, 3)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+import sys
+sys.path.append('../operator')
+
+import poolboy_k8s
+
+from poolboy import Poolboy
+from resourceprovider import ResourceProvider
+from resourcewatcher import ResourceWatcher, _copy_pointer_value
+
+def provider_definition(name, override=None, status_paths=None, template_enable=False):
+    spec = {}
+    if override is not None:
+        spec['override'] = override
+    if status_paths is not None:
+        spec['resourceStatusPaths'] = status_paths
+    if template_enable:
+        spec['template'] = {"enable": True}
+    return {"metadata": {"name": name}, "spec": spec}
+
+def test_resource(status):
+    return {
+        "apiVersion": "v1",
+        "kind": "Test",
+        "metadata": {"name": "test", "resourceVersion": "1"},
+        "status": status,
+    }
+
+class TestResourceWatcher(unittest.TestCase):
+    def setUp(self):
+        ResourceProvider.instances.clear()
+        ResourceWatcher.instances.clear()
+
+    def tearDown(self):
+        ResourceProvider.instances.clear()
+        ResourceWatcher.instances.clear()
+
+    def register_provider(self, *args, **kwargs):
+        definition = provider_definition(*args, **kwargs)
+        ResourceProvider.instances[definition['metadata']['name']] = ResourceProvider(definition=definition)
+
+    def test_00(self):
+        dest = {}
+        _copy_pointer_value({"a": 1, "b": 2}, dest, ["a"])
+        self.assertEqual(dest, {"a": 1})
+
+    def test_01(self):
+        dest = {}
+        _copy_pointer_value({"a": 1}, dest, ["missing"])
+        _copy_pointer_value({"a": 1}, dest, ["a", "b"])
+        self.assertEqual(dest, {"a": 1})
+
+    def test_02(self):
+        source = {"a": {"b": {"c": 1, "d": 2}, "e": 3}}
+        dest = {}
+        _copy_pointer_value(source, dest, ["a", "b", "c"])
+        _copy_pointer_value(source, dest, ["a", "e"])
+        self.assertEqual(dest, {"a": {"b": {"c": 1}, "e": 3}})
+        self.assertEqual(source, {"a": {"b": {"c": 1, "d": 2}, "e": 3}})
+
+    def test_03(self):
+        source = {"a": {"b": 1, "c": 2}}
+        dest = {}
+        _copy_pointer_value(source, dest, ["a"])
+        _copy_pointer_value(source, dest, ["a", "b"])
+        self.assertEqual(dest, {"a": {"b": 1, "c": 2}})
+
+    def test_04(self):
+        source = {"a": [{"b": 1}, {"b": 2}]}
+        dest = {}
+        _copy_pointer_value(source, dest, ["a", "0", "b"])
+        self.assertEqual(dest, {"a": [{"b": 1}, {"b": 2}]})
+
+    def test_05(self):
+        cache_entry = ResourceWatcher.CacheEntry(
+            test_resource({"a": {"b": 1, "c": 2}, "d": 3, "diffBase": "x"}),
+            frozenset(["/a/b", "/missing"]),
+        )
+        self.assertEqual(cache_entry.resource['status'], {"a": {"b": 1}})
+
+    def test_06(self):
+        cache_entry = ResourceWatcher.CacheEntry(test_resource({"a": 1, "b": 2}))
+        self.assertEqual(cache_entry.resource['status'], {"a": 1, "b": 2})
+        fingerprint = cache_entry.fingerprint
+        cache_entry.project(frozenset(["/a"]))
+        self.assertEqual(cache_entry.resource['status'], {"a": 1})
+        self.assertNotEqual(cache_entry.fingerprint, fingerprint)
+
+    def test_07(self):
+        fingerprint = ResourceWatcher.CacheEntry(test_resource({"a": 1, "b": 2}), frozenset(["/a"])).fingerprint
+        resource = test_resource({"a": 1, "b": 3})
+        resource['metadata']['resourceVersion'] = "2"
+        self.assertEqual(ResourceWatcher.CacheEntry(resource, frozenset(["/a"])).fingerprint, fingerprint)
+
+    def test_08(self):
+        self.register_provider("a", override={"apiVersion": "v1", "kind": "Test"}, status_paths=["/a"])
+        self.register_provider("b", override={"apiVersion": "v1", "kind": "Test"}, status_paths=["/b"])
+        self.register_provider("c", override={"apiVersion": "v1", "kind": "Other"})
+        self.assertEqual(
+            ResourceProvider.get_resource_status_paths(api_version="v1", kind="Test"),
+            frozenset(["/a", "/b"]),
+        )
+        self.assertIsNone(ResourceProvider.get_resource_status_paths(api_version="v1", kind="Other"))
+        self.assertIsNone(ResourceProvider.get_resource_status_paths(api_version="v1", kind="Unknown"))
+
+    def test_09(self):
+        self.register_provider("a", override={"apiVersion": "v1", "kind": "Test"}, status_paths=["/a"])
+        self.register_provider("b", override={"kind": "{{ kind }}"}, status_paths=["/b"], template_enable=True)
+        self.assertEqual(
+            ResourceProvider.get_resource_status_paths(api_version="v1", kind="Test"),
+            frozenset(["/a", "/b"]),
+        )
+        self.register_provider("c", override={"metadata": {"labels": {"a": "b"}}})
+        self.assertIsNone(ResourceProvider.get_resource_status_paths(api_version="v1", kind="Test"))
+
+    def test_10(self):
+        self.register_provider("a", override={"apiVersion": "v1", "kind": "Test"}, status_paths=["/a"])
+        resource_watcher = ResourceWatcher(api_version="v1", kind="Test")
+        ResourceWatcher.instances[("v1", "Test")] = resource_watcher
+        self.assertEqual(resource_watcher.status_paths, frozenset(["/a"]))
+        resource_watcher.cache[(None, "test")] = ResourceWatcher.CacheEntry(
+            test_resource({"a": 1, "b": 2}), resource_watcher.status_paths
+        )
+
+        # Paths added by another provider are not in cache so cache is cleared
+        self.register_provider("b", override={"apiVersion": "v1", "kind": "Test"}, status_paths=["/b"])
+        ResourceWatcher.refresh_all_status_paths()
+        self.assertEqual(resource_watcher.status_paths, frozenset(["/a", "/b"]))
+        self.assertEqual(resource_watcher.cache, {})
+
+        resource_watcher.cache[(None, "test")] = ResourceWatcher.CacheEntry(
+            test_resource({"a": 1, "b": 2, "c": 3}), resource_watcher.status_paths
+        )
+        del ResourceProvider.instances["b"]
+        ResourceWatcher.refresh_all_status_paths()
+        self.assertEqual(resource_watcher.status_paths, frozenset(["/a"]))
+        self.assertEqual(resource_watcher.cache[(None, "test")].resource['status'], {"a": 1})
+
+    def test_11(self):
+        resource_watcher = ResourceWatcher(api_version="v1", kind="Test")
+        resource_watcher.connected = True
+        resource_watcher.synced.set()
+        ResourceWatcher.instances[("v1", "Test")] = resource_watcher
+        get_count = 0
+
+        async def get_object(**kwargs):
+            nonlocal get_count
+            get_count += 1
+            return test_resource({"a": get_count})
+
+        async def get_resource():
+            return await ResourceWatcher.get_resource(api_version="v1", kind="Test", name="test")
+
+        get_object_orig = poolboy_k8s.get_object
+        poolboy_k8s.get_object = get_object
+        try:
+            # Entries from GET expire while the watch is live
+            self.assertEqual(asyncio.run(get_resource())['status'], {"a": 1})
+            self.assertTrue(resource_watcher.cache[(None, "test")].from_get)
+            self.assertEqual(asyncio.run(get_resource())['status'], {"a": 1})
+            resource_watcher.cache[(None, "test")].cache_time -= Poolboy.resource_refresh_interval + 1
+            self.assertEqual(asyncio.run(get_resource())['status'], {"a": 2})
+
+            # Entries from list or watch do not expire while the watch is live
+            resource_watcher.cache[(None, "test")] = ResourceWatcher.CacheEntry(test_resource({"a": 0}))
+            resource_watcher.cache[(None, "test")].cache_time -= Poolboy.resource_refresh_interval + 1
+            self.assertEqual(asyncio.run(get_resource())['status'], {"a": 0})
+            self.assertEqual(get_count, 2)
+        finally:
+            poolboy_k8s.get_object = get_object_orig
+
+    def test_12(self):
+        resource_watcher = ResourceWatcher(api_version="v1", kind="Test")
+        resource_watcher.cache[(None, "test")] = ResourceWatcher.CacheEntry(test_resource({"a": 0}), from_get=True)
+        events = []
+
+        async def call_raw(method, **kwargs):
+            return {
+                "items": [test_resource({"a": 1}), {**test_resource({"a": 1}), "metadata": {"name": "other"}}],
+                "metadata": {"resourceVersion": "2"},
+            }
+
+        async def watch_event(event_type, event_obj):
+            events.append((event_type, event_obj['metadata']['name']))
+
+        call_raw_orig = poolboy_k8s.call_raw
+        poolboy_k8s.call_raw = call_raw
+        resource_watcher._ResourceWatcher__watch_event = watch_event
+        try:
+            # First list does not dispatch events for entries filled by GET
+            asyncio.run(resource_watcher._ResourceWatcher__list(None))
+            self.assertEqual(events, [])
+            self.assertTrue(resource_watcher.synced.is_set())
+
+            del resource_watcher.cache[(None, "other")]
+            asyncio.run(resource_watcher._ResourceWatcher__list(None))
+            self.assertEqual(events, [("ADDED", "other")])
+        finally:
+            poolboy_k8s.call_raw = call_raw_orig
+
+if __name__ == '__main__':
+    unittest.main()